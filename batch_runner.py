@@ -0,0 +1,214 @@
+"""Headless batch runner: evaluate a table of scenarios and stream the projections to Parquet.
+
+Usage:
+    python batch_runner.py scenarios.parquet results/ --chunk-size 10000
+
+The input has one row per parameter set, with the same column names as the app's ``parameters``
+dict. Price series are list columns in Parquet, or strings such as ``"10,9,9,8"`` / ``"[10, 9]"``
+in CSV. Rows are read, evaluated and written one chunk at a time, so memory does not grow with the
+input. Each chunk becomes one part file in ``results/yearly`` (one row per scenario and year) and
+``results/summary`` (one row per scenario). Re-running the same command after an interruption
+skips the chunks that were already written.
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from cost_engine import INPUTS, project_costs
+
+SCALAR_COLUMNS = (
+    'base_other_costs',
+    *(f'base_{name}_units' for name in INPUTS),
+    'years',
+    'raw_material_utilisation',
+    'operational_labour_efficiency',
+    *(f'target_efficiency_{name}' for name in INPUTS),
+    'traditional_price',
+    'target_tipping_year',
+)
+PRICE_COLUMNS = tuple(f'{name}_prices' for name in INPUTS)
+MANIFEST = '_run.json'
+
+BatchSummary = namedtuple('BatchSummary', ['chunks', 'skipped_chunks', 'scenarios'])
+
+
+def price_matrix(values, years, column=''):
+    """Stack one price column of a chunk into a (rows, years) array.
+
+    Cells are list values (Parquet) or strings such as ``"10,9,9"`` or ``"[10; 9; 9]"`` (CSV). A
+    single number, which is how CSV readers parse a one-year series, is a one-value series.
+    """
+    values = list(values)
+    if values and all(isinstance(value, str) for value in values):
+        # CSV cells: split and parse the whole column with Arrow kernels rather than per row
+        cells = pc.utf8_trim(pc.replace_substring_regex(pa.array(values), r'[\[\]]', ''), ' \t')
+        series = pc.split_pattern_regex(cells, r'[,;\s]+')
+        lengths = pc.list_value_length(series).to_numpy()
+        flat = pc.cast(series.flatten(), pa.float64()).to_numpy()
+    else:
+        arrays = [np.atleast_1d(np.asarray(value, dtype=float)) for value in values]
+        lengths = np.array([len(array) for array in arrays])
+        flat = np.concatenate(arrays) if arrays else np.empty(0)
+    if len(lengths) and lengths.min() < years:
+        raise ValueError(f'{column} has {lengths.min()} values in some rows but years is {years}')
+    if len(set(lengths.tolist())) <= 1:
+        return flat.reshape(len(values), -1)[:, :years]
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return flat[starts[:, None] + np.arange(years)]
+
+
+def read_chunks(path, chunk_size):
+    """Yield the input table ``chunk_size`` rows at a time as DataFrames."""
+    if path.endswith('.parquet') or path.endswith('.pq'):
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield record_batch.to_pandas()
+    elif path.endswith('.csv'):
+        yield from pd.read_csv(path, chunksize=chunk_size, float_precision='round_trip')
+    else:
+        raise ValueError(f'unsupported input format for {path!r}, expected .csv or .parquet')
+
+
+def _check_columns(frame):
+    missing = [column for column in SCALAR_COLUMNS + PRICE_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f'scenario table is missing columns: {", ".join(missing)}')
+
+
+def frame_batches(frame):
+    """Split a chunk of scenario rows into project_costs batches, one per distinct number of years."""
+    _check_columns(frame)
+    years_column = frame['years'].to_numpy(dtype=int)
+    for years in np.unique(years_column):
+        rows = frame[years_column == years]
+        prices = np.stack([price_matrix(rows[column], years, column) for column in PRICE_COLUMNS], axis=1)
+
+        def column(key):
+            return rows[key].to_numpy(dtype=float)
+
+        yield rows.index.to_numpy(), {
+            'base_other_costs': column('base_other_costs'),
+            'base_units': np.stack([column(f'base_{name}_units') for name in INPUTS], axis=-1),
+            'prices': prices,
+            'years': int(years),
+            'raw_material_utilisation': column('raw_material_utilisation'),
+            'operational_labour_efficiency': column('operational_labour_efficiency'),
+            'target_efficiencies': np.stack([column(f'target_efficiency_{name}') for name in INPUTS], axis=-1),
+            'traditional_price': column('traditional_price'),
+            'target_tipping_year': rows['target_tipping_year'].to_numpy(dtype=int),
+        }
+
+
+def evaluate_frame(frame):
+    """Per-year and per-scenario result tables for one chunk of scenario rows."""
+    if 'scenario_id' in frame.columns:
+        frame = frame.set_index('scenario_id')
+    yearly, summary = [], []
+    for scenario_ids, batch in frame_batches(frame):
+        projection = project_costs(**batch)
+        n, years = projection.costs_per_ton.shape
+        table = {
+            'scenario_id': np.repeat(scenario_ids, years),
+            'year': np.tile(np.arange(years), n),
+            'costs_per_ton': projection.costs_per_ton.ravel(),
+            'total_costs': projection.total_costs.ravel(),
+        }
+        for k, name in enumerate(INPUTS):
+            table[f'{name}_costs'] = projection.input_costs[:, k, :].ravel()
+        yearly.append(pa.table(table))
+        summary.append(pa.table({
+            'scenario_id': scenario_ids,
+            'years': np.full(n, years),
+            'intersection_year': projection.intersection_year,
+            'subsidy': projection.subsidy,
+        }))
+    return pa.concat_tables(yearly), pa.concat_tables(summary)
+
+
+def _write_atomically(table, path):
+    temporary = f'{path}.tmp'
+    pq.write_table(table, temporary)
+    os.replace(temporary, path)
+
+
+def _check_manifest(output_dir, manifest, overwrite):
+    path = os.path.join(output_dir, MANIFEST)
+    if os.path.exists(path) and not overwrite:
+        with open(path) as file:
+            previous = json.load(file)
+        if previous != manifest:
+            raise ValueError(
+                f'{output_dir} holds results from a different run ({previous}); use --overwrite to start again'
+            )
+    if overwrite:
+        # parts from an earlier run with more chunks would otherwise be read along with the new ones
+        for subdirectory in ('yearly', 'summary'):
+            directory = os.path.join(output_dir, subdirectory)
+            for name in os.listdir(directory):
+                if name.startswith('part-'):
+                    os.remove(os.path.join(directory, name))
+    with open(path, 'w') as file:
+        json.dump(manifest, file)
+
+
+def run_batch(input_path, output_dir, chunk_size=10_000, overwrite=False, progress=None):
+    """Evaluate every scenario in ``input_path`` and write partitioned Parquet to ``output_dir``.
+
+    Chunk i is written as ``part-{i}.parquet`` under ``yearly/`` then ``summary/``; a chunk whose
+    summary part exists is complete and is skipped when the run is resumed.
+    """
+    stat = os.stat(input_path)
+    manifest = {
+        'input': os.path.abspath(input_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'chunk_size': chunk_size,
+    }
+    for subdirectory in ('yearly', 'summary'):
+        os.makedirs(os.path.join(output_dir, subdirectory), exist_ok=True)
+    _check_manifest(output_dir, manifest, overwrite)
+
+    chunks = skipped = scenarios = 0
+    for index, frame in enumerate(read_chunks(input_path, chunk_size)):
+        part = f'part-{index:06d}.parquet'
+        yearly_path = os.path.join(output_dir, 'yearly', part)
+        summary_path = os.path.join(output_dir, 'summary', part)
+        if not overwrite and os.path.exists(summary_path) and os.path.exists(yearly_path):
+            skipped += 1
+        else:
+            # global row numbers identify scenarios when the table has no scenario_id column
+            frame.index = pd.RangeIndex(index * chunk_size, index * chunk_size + len(frame))
+            yearly, summary = evaluate_frame(frame)
+            _write_atomically(yearly, yearly_path)
+            _write_atomically(summary, summary_path)
+        chunks += 1
+        scenarios += len(frame)
+        if progress is not None:
+            progress(chunks, scenarios)
+    return BatchSummary(chunks, skipped, scenarios)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run green steel cost projections for a table of scenarios.')
+    parser.add_argument('input', help='scenario table (.csv or .parquet), one row per parameter set')
+    parser.add_argument('output', help='directory for the partitioned Parquet results')
+    parser.add_argument('--chunk-size', type=int, default=10_000, help='scenarios evaluated and written per part file')
+    parser.add_argument('--overwrite', action='store_true', help='recompute every chunk instead of resuming')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    def progress(chunks, scenarios):
+        print(f'chunk {chunks}: {scenarios:,} scenarios', flush=True)
+
+    summary = run_batch(args.input, args.output, args.chunk_size, args.overwrite, None if args.quiet else progress)
+    print(f'{summary.scenarios:,} scenarios in {summary.chunks} chunks ({summary.skipped_chunks} already done)')
+
+
+if __name__ == '__main__':
+    main()
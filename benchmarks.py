@@ -0,0 +1,333 @@
+"""Benchmarks for the cost projection, scenario sweeps, chart rendering and the Streamlit rerun.
+
+Usage:
+    python benchmarks.py                 # run everything and append to benchmark_history.jsonl
+    python benchmarks.py --quick         # smaller sizes, for a fast check before committing
+    python benchmarks.py --filter render --no-save
+
+Each run is appended to the history file as one JSON line with the commit, machine and per-case
+timings, and is compared against the latest earlier run from the same machine so slowdowns show
+up between commits.
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from collections import namedtuple
+
+import numpy as np
+
+from cost_engine import INPUTS, project_costs, project_parameter_sets, stack_parameters
+from incremental_projection import MIN_INCREMENTAL_ELEMENTS, IncrementalProjection
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HISTORY = os.path.join(HERE, 'benchmark_history.jsonl')
+APP = os.path.join(HERE, 'green_steel_production_app.py')
+
+Case = namedtuple('Case', ['name', 'setup'])
+
+# The app's default sidebar values, with the price series repeated out to any horizon
+DEFAULT_PARAMETERS = {
+    'base_other_costs': 100,
+    'base_hydrogen_units': 20,
+    'base_electricity_units': 10,
+    'base_ironore_units': 5,
+    'base_carbon_units': 10,
+    'base_labour_units': 5,
+    'hydrogen_prices': [10, 9, 9, 8, 8, 8, 8, 8, 8, 8],
+    'electricity_prices': [15, 15, 13, 13, 14, 14, 13, 13, 13, 13],
+    'ironore_prices': [4, 4, 5, 5, 6, 4, 3, 4, 3, 3],
+    'carbon_prices': [7, 8, 8, 8, 9, 9, 9, 9, 9, 9],
+    'labour_prices': [16, 17, 18, 18, 18, 20, 20, 20, 20, 22],
+    'years': 10,
+    'raw_material_utilisation': 0.2,
+    'operational_labour_efficiency': 0.3,
+    'target_efficiency_hydrogen': 0.2,
+    'target_efficiency_electricity': 0.29,
+    'target_efficiency_ironore': 0.4,
+    'target_efficiency_carbon': 0.4,
+    'target_efficiency_labour': 0.2,
+    'traditional_price': 0.3,
+    'target_tipping_year': 1,
+}
+
+
+def parameters_for(years):
+    parameters = dict(DEFAULT_PARAMETERS, years=years)
+    for name in INPUTS:
+        parameters[f'{name}_prices'] = np.resize(DEFAULT_PARAMETERS[f'{name}_prices'], years).tolist()
+    return parameters
+
+
+# Each setup function prepares its inputs outside the timed region and returns the callable to time
+
+def compute_single(years):
+    parameters = parameters_for(years)
+    return lambda: project_parameter_sets([parameters])
+
+
+def sample_efficiencies(rng, size, continuous):
+    # targets on the sliders' 5% grid, or sampled continuously as in Sobol rows, batch files and plant tables
+    return rng.uniform(0, 1, size) if continuous else rng.choice(np.linspace(0, 1, 21), size)
+
+
+def compute_scenarios(scenarios, years=10, continuous=False):
+    rng = np.random.default_rng(0)
+    base = parameters_for(years)
+    prices = np.array([base[f'{name}_prices'] for name in INPUTS]) * rng.uniform(0.8, 1.2, (scenarios, len(INPUTS), 1))
+    efficiencies = sample_efficiencies(rng, (scenarios, len(INPUTS)), continuous)
+    units = np.array([base[f'base_{name}_units'] for name in INPUTS], dtype=float)
+    return lambda: project_costs(100.0, units, prices, years, 0.2, 0.3, efficiencies, 0.3, 1)
+
+
+def compute_incremental(scenarios, years=10):
+    rng = np.random.default_rng(0)
+    base = parameters_for(years)
+    prices = np.array([base[f'{name}_prices'] for name in INPUTS]) * rng.uniform(0.8, 1.2, (scenarios, len(INPUTS), 1))
+    efficiencies = [sample_efficiencies(rng, (scenarios, len(INPUTS)), False) for _ in range(2)]
+    # alternate one efficiency target, the common slider move, so each call recomputes one input
+    efficiencies[1][:, 0] = efficiencies[0][:, 0]
+    efficiencies[1][:, 2:] = efficiencies[0][:, 2:]
+    units = np.array([base[f'base_{name}_units'] for name in INPUTS], dtype=float)
+    projection = IncrementalProjection()
+    step = [0]
+
+    def update():
+        step[0] ^= 1
+        return projection.update(100.0, units, prices, years, 0.2, 0.3, efficiencies[step[0]], 0.3, 1)
+
+    return update
+
+
+def efficiency_sweep(steps, years=10):
+    from efficiency_sweep import sweep_efficiency_targets
+
+    parameters = parameters_for(years)
+    grid = {name: np.linspace(0, 1, steps) for name in INPUTS}
+    return lambda: sweep_efficiency_targets(parameters, grid)
+
+
+def compute_portfolio(plants, years=30, continuous=False):
+    from portfolio import plants_from_table, project_portfolio
+
+    rng = np.random.default_rng(0)
+    base = parameters_for(years)
+    table = {
+        'capacity': rng.uniform(1e5, 5e6, plants),
+        'commissioning_year': rng.integers(0, 10, plants),
+        'ramp_start': rng.uniform(0.2, 1, plants),
+        'ramp_years': rng.integers(0, 5, plants),
+        'raw_material_utilisation': rng.uniform(0.1, 0.5, plants),
+        **{f'target_efficiency_{name}': sample_efficiencies(rng, plants, continuous) for name in INPUTS},
+    }
+    fleet = plants_from_table(table, base)
+    prices = stack_parameters([base])['prices'][0]
+    return lambda: project_portfolio(fleet, prices, years, 0.3, 5)
+
+
+def subsidy_schedule(scenarios, years=30):
+    from subsidy_schedule import optimal_subsidy_schedule
+
+    rng = np.random.default_rng(0)
+    base = parameters_for(years)
+    parameter_sets = [
+        dict(base, **{f'{name}_prices': (np.array(base[f'{name}_prices']) * rng.uniform(0.7, 1.3, years)).tolist() for name in INPUTS})
+        for _ in range(scenarios)
+    ]
+    return lambda: optimal_subsidy_schedule(parameter_sets, 5, budget_caps=150.0, discount_rate=0.035, max_rise=0.0, max_fall=0.05)
+
+
+def render_cost_chart(years):
+    from charts import CostChart
+
+    projection = project_parameter_sets([parameters_for(years)])
+    chart = CostChart()
+    flip = [0]
+
+    def render():
+        # alternate the traditional price so every call has a changed series to redraw
+        flip[0] ^= 1
+        chart.update(projection.costs_per_ton[0], 0.3 + 0.01 * flip[0], 1, float(projection.subsidy[0]), None)
+        return chart.png()
+
+    return render
+
+
+def render_fan_chart(years):
+    from charts import fan_chart_png
+
+    costs = project_parameter_sets([parameters_for(years)]).costs_per_ton[0]
+    quantiles = np.array([0.9 * costs, costs, 1.1 * costs])
+    return lambda: fan_chart_png(quantiles, 0.3, 'Fan chart benchmark')
+
+
+def app_imports():
+    """The app's module-level import statements, what a new app process imports before its first rerun."""
+    with open(APP) as file:
+        tree = ast.parse(file.read())
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def import_time(code):
+    # a fresh interpreter each call, since a module is only really imported once per process
+    command = [sys.executable, '-c', code]
+    return lambda: subprocess.run(command, cwd=HERE, check=True)
+
+
+def traditional_price_input(app):
+    return next(widget for widget in app.sidebar.number_input if widget.label == 'Traditional Price (£/ton)')
+
+
+def streamlit_rerun(kind):
+    from streamlit.testing.v1 import AppTest
+
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    app = AppTest.from_file(APP, default_timeout=600)
+    if kind == 'cold':
+        # a new session with the shared result cache emptied, like the first visit after a restart
+        def cold():
+            import streamlit as st
+
+            st.cache_resource.clear()
+            return AppTest.from_file(APP, default_timeout=600).run()
+
+        return cold
+    app.run()
+    if kind == 'cached':
+        return app.run
+    step = [0]
+
+    def changed():
+        # a new traditional price each time, so the projection and chart miss the cache
+        step[0] += 1
+        traditional_price_input(app).set_value(0.3 + 1e-6 * step[0])
+        return app.run()
+
+    return changed
+
+
+def cases(quick=False):
+    year_sizes = [10, 100] if quick else [10, 100, 1000]
+    scenario_sizes = [1, 100, 10_000] if quick else [1, 100, 10_000, 1_000_000]
+    yield Case('import/python', lambda: import_time('pass'))
+    for module in ['cost_engine', 'batch_runner', 'price_store', 'charts']:
+        yield Case(f'import/{module}', lambda module=module: import_time(f'import {module}'))
+    yield Case('import/app', lambda: import_time(app_imports()))
+    yield from (Case(f'compute/single/years={years}', lambda years=years: compute_single(years)) for years in year_sizes)
+    yield from (Case(f'compute/scenarios={n}', lambda n=n: compute_scenarios(n)) for n in scenario_sizes)
+    # batches large enough for IncrementalProjection to reuse columns rather than recompute whole
+    incremental_sizes = [n for n in scenario_sizes if n * len(INPUTS) * 10 >= MIN_INCREMENTAL_ELEMENTS]
+    yield from (Case(f'compute/incremental/scenarios={n}', lambda n=n: compute_incremental(n)) for n in incremental_sizes)
+    yield from (Case(f'compute/scenarios={n}/continuous', lambda n=n: compute_scenarios(n, continuous=True)) for n in scenario_sizes[1:])
+    for plants in [1000] if quick else [1000, 5000]:
+        yield Case(f'compute/portfolio/plants={plants}', lambda plants=plants: compute_portfolio(plants))
+        yield Case(f'compute/portfolio/plants={plants}/continuous', lambda plants=plants: compute_portfolio(plants, continuous=True))
+    for scenarios in [100] if quick else [100, 1000]:
+        yield Case(f'compute/subsidy_schedule/scenarios={scenarios}', lambda scenarios=scenarios: subsidy_schedule(scenarios))
+    for steps in [10] if quick else [10, 20]:
+        yield Case(f'compute/efficiency_sweep/steps={steps}', lambda steps=steps: efficiency_sweep(steps))
+    yield from (Case(f'render/cost_chart/years={years}', lambda years=years: render_cost_chart(years)) for years in year_sizes)
+    yield from (Case(f'render/fan_chart/years={years}', lambda years=years: render_fan_chart(years)) for years in year_sizes)
+    for kind in ['cold', 'changed', 'cached']:
+        yield Case(f'streamlit/rerun/{kind}', lambda kind=kind: streamlit_rerun(kind))
+
+
+def measure(function, repeat, min_time=0.2):
+    """Per-call timings in seconds: ``repeat`` samples, each averaging enough calls to last ``min_time``."""
+    timer = timeit.Timer(function)
+    number, elapsed = 1, timer.timeit(1)
+    if elapsed < min_time:
+        number = max(1, int(min_time / max(elapsed, 1e-9)))
+    samples = [total / number for total in timer.repeat(repeat, number)]
+    return {
+        'median': float(np.median(samples)),
+        'min': min(samples),
+        'mean': float(np.mean(samples)),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=HERE, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def machine():
+    return {'node': platform.node(), 'processor': platform.processor() or platform.machine(), 'cpus': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__}
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare(record, history, threshold):
+    """Cases whose median got slower than ``threshold`` relative to the latest run on this machine."""
+    previous = next((run for run in reversed(history) if run['machine'] == record['machine']), None)
+    if previous is None:
+        return None, []
+    regressions = []
+    for name, result in record['results'].items():
+        before = previous['results'].get(name)
+        if before is not None and result['median'] > before['median'] * (1 + threshold):
+            regressions.append((name, before['median'], result['median']))
+    return previous, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the green steel cost model.')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes for a fast check')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5, help='timing samples per case')
+    parser.add_argument('--history', default=HISTORY, help='JSON lines file the results are appended to')
+    parser.add_argument('--no-save', action='store_true', help='do not append this run to the history')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 if any case regressed')
+    args = parser.parse_args(argv)
+
+    commit, dirty = git_commit()
+    record = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'dirty': dirty,
+        'quick': args.quick,
+        'machine': machine(),
+        'results': {},
+    }
+    for case in cases(args.quick):
+        if args.filter not in case.name:
+            continue
+        result = measure(case.setup(), args.repeat)
+        record['results'][case.name] = result
+        print(f'{case.name:<44} median {result["median"] * 1e3:12.3f} ms   min {result["min"] * 1e3:12.3f} ms', flush=True)
+
+    history = load_history(args.history)
+    previous, regressions = compare(record, history, args.threshold)
+    if previous is not None:
+        print(f'\ncompared with {previous["commit"] or "unknown commit"} ({previous["timestamp"]})')
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: {before * 1e3:.3f} ms -> {after * 1e3:.3f} ms ({after / before - 1:+.0%})')
+        if not regressions:
+            print('no regressions')
+    if not args.no_save:
+        with open(args.history, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
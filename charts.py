@@ -0,0 +1,237 @@
+import io
+
+import numpy as np
+
+# matplotlib is imported by the functions that draw, not with this module: it takes longer to
+# import than everything else the app needs besides Streamlit, and reruns whose charts all come
+# from the result cache never draw one.
+
+# Black plot area with white text, as the app has always drawn its charts. The colours are set on
+# each artist rather than through rcParams, which are global and shared by every session's thread.
+CHART_FACE_COLOR = 'black'
+CHART_TEXT_COLOR = 'white'
+# Same output settings st.pyplot uses
+PNG_OPTIONS = {'format': 'png', 'bbox_inches': 'tight', 'dpi': 200}
+# Margins for figures with a fixed layout, which skips the extra draw a tight bounding box costs
+FIXED_MARGINS = {'left': 0.12, 'right': 0.95, 'top': 0.86, 'bottom': 0.1}
+
+MAX_POINTS = 2000
+# Overlays are drawn thin and translucent, so far fewer series and points are needed per line
+MAX_OVERLAY_SERIES = 100
+MAX_OVERLAY_POINTS = 256
+
+# Masked heatmap cells (e.g. targets that never tip) stand out from every colour of the scale
+HEATMAP_COLORMAP = 'viridis'
+HEATMAP_BAD_COLOR = 'dimgrey'
+
+
+def figure_png(figure, tight=True):
+    options = dict(PNG_OPTIONS)
+    if not tight:
+        del options['bbox_inches']
+    buffer = io.BytesIO()
+    figure.savefig(buffer, **options)
+    return buffer.getvalue()
+
+
+def styled_axes(figure):
+    axes = figure.add_subplot()
+    axes.set_facecolor(CHART_FACE_COLOR)
+    axes.title.set_color(CHART_TEXT_COLOR)
+    return axes
+
+
+def styled_legend(axes):
+    return axes.legend(facecolor=CHART_FACE_COLOR, labelcolor=CHART_TEXT_COLOR)
+
+
+def downsample(x, y, max_points=MAX_POINTS):
+    """Min/max decimation: keep the lowest and highest point of each bucket, in x order.
+
+    Peaks and troughs survive, so a downsampled cost curve looks the same at screen resolution.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if len(x) <= max_points:
+        return x, y
+    buckets = np.array_split(np.arange(len(x)), max_points // 2)
+    keep = set()
+    for bucket in buckets:
+        values = y[bucket]
+        keep.add(bucket[np.argmin(values)])
+        keep.add(bucket[np.argmax(values)])
+    keep = np.array(sorted(keep))
+    return x[keep], y[keep]
+
+
+def downsample_band(x, low, high, max_points=MAX_POINTS):
+    """Bucketed envelope of a band: the bucket's first x, lowest ``low`` and highest ``high``."""
+    x, low, high = np.asarray(x), np.asarray(low), np.asarray(high)
+    if len(x) <= max_points:
+        return x, low, high
+    starts = np.array([bucket[0] for bucket in np.array_split(np.arange(len(x)), max_points)])
+    return x[starts], np.minimum.reduceat(low, starts), np.maximum.reduceat(high, starts)
+
+
+def thin_overlay(series, max_series=MAX_OVERLAY_SERIES):
+    """At most ``max_series`` rows of a (scenarios, years) overlay, spread evenly over the final-year ranking."""
+    series = np.asarray(series)
+    if len(series) <= max_series:
+        return series
+    order = np.argsort(series[:, -1])
+    return series[order[np.linspace(0, len(order) - 1, max_series).round().astype(int)]]
+
+
+class CostChart:
+    """The cost-per-ton chart as a long-lived figure whose artists are updated in place.
+
+    One instance is kept per session: each update only moves the series and annotations whose
+    data changed, instead of building a new figure, and the figure is owned by the instance
+    (not pyplot's global registry) so it is freed with the session.
+    """
+
+    def __init__(self):
+        from matplotlib.collections import LineCollection
+        from matplotlib.figure import Figure
+
+        self._data = {}
+        self.figure = Figure()
+        self.figure.subplots_adjust(**FIXED_MARGINS)
+        self.axes = styled_axes(self.figure)
+        self.traditional_line, = self.axes.plot([], [], linestyle='--', label='Traditional Price')
+        self.cost_line, = self.axes.plot([], [], label='Cost per Ton')
+        self.overlay = LineCollection([], linewidths=0.5, alpha=0.3, label='_nolegend_')
+        self.axes.add_collection(self.overlay)
+        self.subsidy_line = self.axes.axvline(x=0, color='green', ls='--', label='subsidy')
+        self.axes.set_xlabel('Years')
+        self.axes.set_ylabel('Costs per Ton')
+        self.title = self.axes.set_title('')
+        # Set text and arrow color to white for all annotations
+        arrow_props = dict(arrowstyle='->', color=CHART_TEXT_COLOR)
+        self.subsidy_annotation = self.axes.annotate('', xy=(0, 0), xytext=(0, 0), color=CHART_TEXT_COLOR, arrowprops=arrow_props)
+        self.tipping_annotation = self.axes.annotate('', xy=(0, 0), xytext=(0, 0), color=CHART_TEXT_COLOR, arrowprops=arrow_props)
+        self.legend = None
+
+    def _changed(self, name, value):
+        value = np.asarray(value)
+        previous = self._data.get(name)
+        if previous is not None and previous.shape == value.shape and np.array_equal(previous, value):
+            return False
+        self._data[name] = value
+        return True
+
+    @staticmethod
+    def _point(annotation, xy, text_y, years):
+        # Text sits one year to the right of the point, or to the left in the right part of the
+        # chart so the fixed-size figure doesn't clip it
+        x = xy[0]
+        on_left = x + 1 > 0.6 * (years - 1)
+        annotation.xy = xy
+        annotation.set_position((x - 1 if on_left else x + 1, text_y))
+        annotation.set_horizontalalignment('right' if on_left else 'left')
+
+    def update(self, costs_per_ton, traditional_price, target_tipping_year, subsidy, intersection_year, overlay=None):
+        years = len(costs_per_ton)
+        if self._changed('costs_per_ton', costs_per_ton):
+            self.cost_line.set_data(*downsample(np.arange(years), costs_per_ton))
+        if self._changed('traditional', [years, traditional_price]):
+            self.traditional_line.set_data([0, years - 1], [traditional_price, traditional_price])
+
+        overlay = np.empty((0, years)) if overlay is None else thin_overlay(overlay)
+        if self._changed('overlay', overlay):
+            self.overlay.set_segments([np.column_stack(downsample(np.arange(years), row, MAX_OVERLAY_POINTS)) for row in overlay])
+            self.overlay.set_label('Scenarios' if len(overlay) else '_nolegend_')
+
+        low, high = min(costs_per_ton), max(costs_per_ton)
+        if len(overlay):
+            low, high = min(low, overlay.min()), max(high, overlay.max())
+        self.axes.set_xlim(-0.05 * (years - 1), 1.05 * (years - 1))
+        self.axes.set_ylim(low - 0.1, high + 0.1)  # a small value either side for some padding
+        self.title.set_text(f'Cost per Ton of Steel Production Over Time\n(with target tipping point in year {target_tipping_year} and required subsidy)')
+
+        tipping_cost = costs_per_ton[target_tipping_year]
+        self.subsidy_annotation.set_text(f'Required Subsidy: £{round(subsidy, 4)}/ton')
+        self._point(self.subsidy_annotation, (target_tipping_year, tipping_cost), tipping_cost, years)
+        # only one line may be specified; ymin & ymax specified as a percentage of y-range
+        self.subsidy_line.set_xdata([target_tipping_year, target_tipping_year])
+        self.subsidy_line.set_ydata([traditional_price, costs_per_ton[target_tipping_year - 1]])
+
+        self.tipping_annotation.set_visible(intersection_year is not None)
+        if intersection_year is not None:
+            self.tipping_annotation.set_text(f'Tipping Calendar Year: {intersection_year}')
+            self._point(self.tipping_annotation, (intersection_year, traditional_price), traditional_price * 1.5, years)
+
+        if self._changed('legend', [len(overlay) > 0]):
+            self.legend = styled_legend(self.axes)
+        return self
+
+    def png(self):
+        return figure_png(self.figure, tight=False)
+
+
+def fan_chart_png(quantiles, traditional_price, title, max_points=MAX_POINTS):
+    """P5-P95 band and median line of a Monte Carlo run, rendered on a throwaway figure."""
+    from matplotlib.figure import Figure
+
+    p5, p50, p95 = quantiles
+    years = np.arange(len(p50))
+    figure = Figure()
+    axes = styled_axes(figure)
+    axes.plot([0, len(p50) - 1], [traditional_price] * 2, linestyle='--', label='Traditional Price')
+    axes.fill_between(*downsample_band(years, p5, p95, max_points), alpha=0.3, label='Cost per Ton (P5-P95)')
+    axes.plot(*downsample(years, p50, max_points), label='Cost per Ton (P50)')
+    axes.set_ylim(min(p5) - 0.1, max(p95) + 0.1)  # a small value either side for some padding
+    axes.set_xlabel('Years')
+    axes.set_ylabel('Costs per Ton')
+    axes.set_title(title)
+    styled_legend(axes)
+    return figure_png(figure)
+
+
+def tornado_chart_png(tornado_result, xlabel):
+    from matplotlib.figure import Figure
+
+    bars = list(reversed(tornado_result.bars))
+    base = tornado_result.base_output
+    figure = Figure()
+    axes = styled_axes(figure)
+    names = [bar.name for bar in bars]
+    axes.barh(names, [bar.low_output - base for bar in bars], left=base, label='Low value')
+    axes.barh(names, [bar.high_output - base for bar in bars], left=base, label='High value')
+    axes.axvline(x=base, color='white', ls='--')
+    axes.set_xlabel(xlabel)
+    axes.set_title('Tornado Chart')
+    styled_legend(axes)
+    return figure_png(figure)
+
+
+def sobol_chart_png(sobol_result):
+    from matplotlib.figure import Figure
+
+    order = np.argsort(sobol_result.total_order)
+    positions = np.arange(len(order))
+    figure = Figure()
+    axes = styled_axes(figure)
+    axes.barh(positions - 0.2, sobol_result.first_order[order], height=0.4, label='First Order')
+    axes.barh(positions + 0.2, sobol_result.total_order[order], height=0.4, label='Total')
+    axes.set_yticks(positions, [sobol_result.names[i] for i in order])
+    axes.set_xlabel('Sobol Index')
+    axes.set_title('Sobol Sensitivity Indices')
+    styled_legend(axes)
+    return figure_png(figure)
+
+
+def heatmap_png(values, x_values, y_values, xlabel, ylabel, title, colorbar_label, mask=None):
+    """(y, x) grid of values as a heatmap; cells where ``mask`` is set are drawn grey."""
+    from matplotlib import colormaps
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    axes = styled_axes(figure)
+    image = axes.pcolormesh(
+        x_values, y_values, np.ma.masked_array(values, mask=mask), shading='nearest', cmap=colormaps[HEATMAP_COLORMAP].with_extremes(bad=HEATMAP_BAD_COLOR)
+    )
+    figure.colorbar(image, ax=axes, label=colorbar_label)
+    axes.set_xlabel(xlabel)
+    axes.set_ylabel(ylabel)
+    axes.set_title(title)
+    return figure_png(figure)
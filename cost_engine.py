@@ -0,0 +1,164 @@
+import numpy as np
+from collections import namedtuple
+
+# Production inputs in the order they are stacked along the "inputs" axis
+INPUTS = ('hydrogen', 'electricity', 'ironore', 'carbon', 'labour')
+FIXED_PRODUCTION = 1000
+
+# Sentinel used in place of None when a scenario never reaches the traditional price
+NO_INTERSECTION = -1
+
+CostProjection = namedtuple(
+    'CostProjection',
+    ['input_costs', 'total_costs', 'costs_per_ton', 'intersection_year', 'subsidy'],
+)
+
+
+def waste_fractions(raw_material_utilisation, operational_labour_efficiency):
+    """Fraction of the base units of each input that is wasted, shape (..., inputs)."""
+    raw_waste = 1 - np.asarray(raw_material_utilisation, dtype=float)
+    labour_waste = 1 - np.asarray(operational_labour_efficiency, dtype=float)
+    raw_waste, labour_waste = np.broadcast_arrays(raw_waste, labour_waste)
+    return np.stack([raw_waste, raw_waste, raw_waste, raw_waste, labour_waste], axis=-1)
+
+
+def decay_factors(retention, years):
+    """``retention ** i`` for i in range(years), shape (..., years).
+
+    numpy's pow can differ from the scalar projection loop's float pow in the last bit, so costs
+    agree with that loop to within rounding rather than bit for bit.
+    """
+    retention = np.asarray(retention, dtype=float)
+    return np.power(retention[..., None], np.arange(years))
+
+
+def project_input_costs(base_units, prices, wasted_fraction, target_efficiencies, years):
+    """Per-input cost projection, shape (..., inputs, years).
+
+    Wasted resource-units diminish by the YoY target efficiency, so the units of an input
+    in year i are ``units - wasted * (1 - (1 - e) ** i)`` and its cost is that times the price.
+    """
+    base_units = np.asarray(base_units, dtype=float)[..., None]
+    prices = np.asarray(prices, dtype=float)
+    if prices.shape[-1] < years:
+        raise ValueError(f'price series have {prices.shape[-1]} values but {years} years were requested')
+    prices = prices[..., :years]
+
+    base_wasted_units = base_units * np.asarray(wasted_fraction, dtype=float)[..., None]
+    decay = decay_factors(1 - np.asarray(target_efficiencies, dtype=float), years)
+
+    # wasted -> savings -> units -> costs, reusing one buffer to keep large batches memory-bound only once
+    costs = np.empty(np.broadcast_shapes(base_units.shape, base_wasted_units.shape, decay.shape, prices.shape))
+    np.multiply(base_wasted_units, decay, out=costs)
+    np.subtract(base_wasted_units, costs, out=costs)
+    np.subtract(base_units, costs, out=costs)
+    np.multiply(costs, prices, out=costs)
+    return costs
+
+
+def sum_input_costs(base_other_costs, input_costs):
+    """Total costs per year, adding inputs in the same order as the original projection loop."""
+    total_costs = np.asarray(base_other_costs, dtype=float)[..., None] + input_costs[..., 0, :]
+    for k in range(1, len(INPUTS)):
+        total_costs += input_costs[..., k, :]
+    return total_costs
+
+
+def find_intersection_year(costs_per_ton, traditional_price):
+    """Year index reported as the tipping point, or NO_INTERSECTION.
+
+    Matches the app's convention: the first year i >= 1 whose cost per ton is at or below the
+    traditional price is reported as year i - 1.
+    """
+    crossed = costs_per_ton[..., 1:] <= np.asarray(traditional_price, dtype=float)[..., None]
+    if crossed.shape[-1] == 0:
+        # a one-year projection has no year i >= 1 to cross in
+        return np.full(crossed.shape[:-1], NO_INTERSECTION)
+    first = np.argmax(crossed, axis=-1)
+    return np.where(crossed.any(axis=-1), first, NO_INTERSECTION)
+
+
+def subsidy_at(costs_per_ton, traditional_price, target_tipping_year):
+    """Cost per ton above the traditional price in the target tipping year."""
+    years = costs_per_ton.shape[-1]
+    tipping_year = np.asarray(target_tipping_year, dtype=int)
+    if np.any((tipping_year < -years) | (tipping_year >= years)):
+        raise IndexError(f'target tipping year out of range for a {years} year projection')
+    tipping_year = np.where(tipping_year < 0, tipping_year + years, tipping_year)
+    tipping_year = np.broadcast_to(tipping_year, costs_per_ton.shape[:-1])
+    tipping_costs = np.take_along_axis(costs_per_ton, tipping_year[..., None], axis=-1)[..., 0]
+    return tipping_costs - np.asarray(traditional_price, dtype=float)
+
+
+def project_costs(
+    base_other_costs,
+    base_units,
+    prices,
+    years,
+    raw_material_utilisation,
+    operational_labour_efficiency,
+    target_efficiencies,
+    traditional_price,
+    target_tipping_year,
+    ):
+    """Vectorized cost projection for a batch of scenarios.
+
+    Scenario parameters broadcast against each other over any leading batch shape:
+    ``base_units`` and ``target_efficiencies`` are (..., inputs) and ``prices`` is
+    (..., inputs, years); the remaining parameters are scalars per scenario.
+    """
+    input_costs = project_input_costs(
+        base_units,
+        prices,
+        waste_fractions(raw_material_utilisation, operational_labour_efficiency),
+        target_efficiencies,
+        years,
+    )
+    total_costs = sum_input_costs(base_other_costs, input_costs)
+    costs_per_ton = total_costs / FIXED_PRODUCTION
+    return CostProjection(
+        input_costs=input_costs,
+        total_costs=total_costs,
+        costs_per_ton=costs_per_ton,
+        intersection_year=find_intersection_year(costs_per_ton, traditional_price),
+        subsidy=subsidy_at(costs_per_ton, traditional_price, target_tipping_year),
+    )
+
+
+def stack_parameters(parameter_sets):
+    """Turn a list of app ``parameters`` dicts into batched keyword arguments for project_costs."""
+    parameter_sets = list(parameter_sets)
+    if not parameter_sets:
+        raise ValueError('at least one parameter set is required')
+    years = {int(p['years']) for p in parameter_sets}
+    if len(years) != 1:
+        raise ValueError(f'all parameter sets must share the same number of years, got {sorted(years)}')
+    years = years.pop()
+
+    prices = np.empty((len(parameter_sets), len(INPUTS), years))
+    for s, p in enumerate(parameter_sets):
+        for k, name in enumerate(INPUTS):
+            series = p[f'{name}_prices']
+            if len(series) < years:
+                raise ValueError(f'{name}_prices has {len(series)} values but years is {years}')
+            prices[s, k] = series[:years]
+
+    def column(key):
+        return np.array([p[key] for p in parameter_sets], dtype=float)
+
+    return {
+        'base_other_costs': column('base_other_costs'),
+        'base_units': np.stack([column(f'base_{name}_units') for name in INPUTS], axis=-1),
+        'prices': prices,
+        'years': years,
+        'raw_material_utilisation': column('raw_material_utilisation'),
+        'operational_labour_efficiency': column('operational_labour_efficiency'),
+        'target_efficiencies': np.stack([column(f'target_efficiency_{name}') for name in INPUTS], axis=-1),
+        'traditional_price': column('traditional_price'),
+        'target_tipping_year': np.array([int(p['target_tipping_year']) for p in parameter_sets]),
+    }
+
+
+def project_parameter_sets(parameter_sets):
+    """Evaluate a list of app ``parameters`` dicts in one vectorized pass."""
+    return project_costs(**stack_parameters(parameter_sets))
@@ -0,0 +1,166 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from math import prod
+
+import numpy as np
+
+from cost_engine import FIXED_PRODUCTION, INPUTS, NO_INTERSECTION, project_input_costs, stack_parameters, waste_fractions
+
+# Tipping year and subsidy over the grid, shape (len(values[0]), len(values[1]), ...) in the order
+# of ``names``; ``scenario_years`` counts the (scenario, year) costs actually evaluated.
+SweepResult = namedtuple('SweepResult', ['names', 'values', 'tipping_year', 'subsidy', 'scenario_years'])
+
+# Largest merged table of leading inputs (in elements) kept per sweep
+MAX_PREFIX_ELEMENTS = 2 ** 20
+# Below this share of a chunk still scanning, gathering the remaining scenarios beats broadcasting
+SPARSE_FRACTION = 0.125
+
+
+def input_cost_tables(parameters, grid):
+    """Per-input cost paths for every grid value of that input's target, a (values, years) table each.
+
+    Inputs without grid values keep the target in ``parameters`` and get a one-row table. Total cost
+    is other costs plus the sum of these tables, so a grid of any size needs only their rows.
+    """
+    unknown = sorted(set(grid) - set(INPUTS))
+    if unknown:
+        raise ValueError(f'grid keys must be input names {INPUTS}, got {unknown}')
+    batch = stack_parameters([parameters])
+    wasted_fraction = waste_fractions(batch['raw_material_utilisation'], batch['operational_labour_efficiency'])[0]
+    tables = []
+    for k, name in enumerate(INPUTS):
+        values = np.asarray(grid.get(name, batch['target_efficiencies'][0, k:k + 1]), dtype=float)
+        tables.append(project_input_costs(batch['base_units'][0, k], batch['prices'][0, k], wasted_fraction[k], values, batch['years']))
+    return batch, tables
+
+
+def _prefix_tables(base_other_costs, tables, max_elements=MAX_PREFIX_ELEMENTS):
+    # Fold other costs and the leading inputs into one table of their partial sums, in the same
+    # left-to-right order as sum_input_costs so every total stays bit-identical to project_costs.
+    prefix = base_other_costs + tables[0]
+    rest = list(tables[1:])
+    while rest and prefix.size * len(rest[0]) <= max_elements:
+        prefix = (prefix[:, None, :] + rest.pop(0)[None, :, :]).reshape(-1, prefix.shape[-1])
+    return [prefix] + rest
+
+
+def _floors(tables):
+    # floors[k][row, y] is the lowest cost in table k from year y onwards
+    return [np.minimum.accumulate(table[:, ::-1], axis=-1)[:, ::-1] for table in tables]
+
+
+def _block_costs(tables, year, rows):
+    # costs per ton in one year of the grid block whose leading table rows are ``rows``, flattened;
+    # broadcasting adds the tables in the same order as the scenario-by-scenario sum
+    total = tables[0][rows, year]
+    for table in tables[1:]:
+        total = total[..., None] + table[:, year]
+    return total.ravel() / FIXED_PRODUCTION
+
+
+def _sweep_chunk(tables, floors, traditional_price, target_tipping_year, row_start, row_stop):
+    """Tipping year and subsidy of the grid block with leading table rows ``row_start:row_stop``.
+
+    Years are scanned only while a scenario can still cross: it leaves the scan once it has crossed,
+    or once the sum of its inputs' lowest remaining costs is above the traditional price. That bound
+    is added in the same order as the costs, and rounding is monotone, so it never exceeds a
+    computed cost and drops nothing that would cross. While most of the block is still scanning it
+    is evaluated whole by broadcasting; after that only the remaining scenarios are gathered.
+    """
+    rows = slice(row_start, row_stop)
+    shape = (row_stop - row_start,) + tuple(len(table) for table in tables[1:])
+    subsidy = _block_costs(tables, target_tipping_year, rows) - traditional_price
+    n = subsidy.size
+    tipping_year = np.full(n, NO_INTERSECTION)
+    scanning = np.ones(n, dtype=bool)
+    active = index = None
+    scenario_years = n
+
+    def gathered_costs(year, tables):
+        total = tables[0][index[0] + row_start, year]
+        for k in range(1, len(tables)):
+            total += tables[k][index[k], year]
+        return total / FIXED_PRODUCTION
+
+    # same convention as find_intersection_year: first year i >= 1 at or below the price, reported as i - 1
+    for year in range(1, tables[0].shape[-1]):
+        # check the bound at years 1, 2, 4, 8, ... so it costs a logarithmic number of passes
+        check_bound = year & (year - 1) == 0
+        if active is None:
+            if check_bound:
+                scanning &= _block_costs(floors, year, rows) <= traditional_price
+            if np.count_nonzero(scanning) > n * SPARSE_FRACTION:
+                scenario_years += n
+                crossed = scanning & (_block_costs(tables, year, rows) <= traditional_price)
+                tipping_year[crossed] = year - 1
+                scanning &= ~crossed
+                continue
+            active = np.flatnonzero(scanning)
+            index = np.unravel_index(active, shape)
+        elif check_bound:
+            keep = gathered_costs(year, floors) <= traditional_price
+            active, index = active[keep], tuple(axis[keep] for axis in index)
+        if not len(active):
+            break
+        scenario_years += len(active)
+        crossed = gathered_costs(year, tables) <= traditional_price
+        tipping_year[active[crossed]] = year - 1
+        active, index = active[~crossed], tuple(axis[~crossed] for axis in index)
+    return tipping_year, subsidy, scenario_years
+
+
+def sweep_efficiency_targets(parameters, grid, chunk_size=1_000_000, workers=None):
+    """Tipping year and required subsidy for every combination of efficiency targets in ``grid``.
+
+    ``grid`` maps input names to the target values to sweep; a full grid names all five inputs and a
+    2-D slice names two, with the others held at their values in ``parameters``. Grid points are
+    split into chunks of about ``chunk_size`` and spread over ``workers`` processes (all cores by
+    default, ``0`` or ``1`` stays in-process). A scenario's years stop being evaluated once its cost
+    per ton has crossed the traditional price, or can no longer reach it.
+    """
+    batch, tables = input_cost_tables(parameters, grid)
+    years = batch['years']
+    target_tipping_year = int(batch['target_tipping_year'][0])
+    if not -years <= target_tipping_year < years:
+        raise IndexError(f'target tipping year out of range for a {years} year projection')
+    target_tipping_year %= years
+
+    names = [name for name in INPUTS if name in grid]
+    values = [np.asarray(grid[name], dtype=float) for name in names]
+    tables = _prefix_tables(batch['base_other_costs'][0], tables)
+    floors = _floors(tables)
+    # chunks are whole rows of the leading table, i.e. about chunk_size grid points each
+    row_size = prod(len(table) for table in tables[1:])
+    rows_per_chunk = max(1, chunk_size // row_size)
+    traditional_price = batch['traditional_price'][0]
+    tasks = [
+        (tables, floors, traditional_price, target_tipping_year, start, min(start + rows_per_chunk, len(tables[0])))
+        for start in range(0, len(tables[0]), rows_per_chunk)
+    ]
+
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        results = [_sweep_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_sweep_chunk, *zip(*tasks)))
+
+    shape = tuple(len(value) for value in values)
+    tipping_year = np.concatenate([result[0] for result in results]).reshape(shape)
+    subsidy = np.concatenate([result[1] for result in results]).reshape(shape)
+    return SweepResult(names, values, tipping_year, subsidy, sum(result[2] for result in results))
+
+
+def best_over_other_targets(result, x_name, y_name):
+    """Earliest tipping year and lowest subsidy on the (y, x) grid, over every value of the other swept targets."""
+    axes = tuple(i for i, name in enumerate(result.names) if name not in (x_name, y_name))
+    never = np.iinfo(result.tipping_year.dtype).max
+    tipping_year = np.where(result.tipping_year == NO_INTERSECTION, never, result.tipping_year).min(axis=axes)
+    tipping_year = np.where(tipping_year == never, NO_INTERSECTION, tipping_year)
+    subsidy = result.subsidy.min(axis=axes)
+    remaining = [name for name in result.names if name in (x_name, y_name)]
+    if remaining.index(y_name) > remaining.index(x_name):
+        tipping_year, subsidy = tipping_year.T, subsidy.T
+    return tipping_year, subsidy
@@ -1,9 +1,87 @@
+import hashlib
+import io
+import os
+
 import streamlit as st
-import matplotlib.pyplot as plt
 import numpy as np
-import plotly.express as px
 import pandas as pd
-from streamlit import info as st_info
+
+from cost_engine import INPUTS, NO_INTERSECTION, stack_parameters
+from incremental_projection import IncrementalProjection
+from monte_carlo import correlation_cholesky, run_monte_carlo
+from sensitivity import OUTPUTS as SENSITIVITY_OUTPUTS, sobol_indices, tornado
+from inverse_solver import break_even_prices, least_cost_efficiency_mix, required_efficiency
+from result_cache import ResultCache, parameters_key
+from price_store import PriceStore, manifest_mtime
+from efficiency_sweep import best_over_other_targets, sweep_efficiency_targets
+from portfolio import plants_from_table, project_portfolio, tipping_year_counts
+from subsidy_schedule import optimal_subsidy_schedule
+from charts import CostChart, fan_chart_png, heatmap_png, sobol_chart_png, tornado_chart_png
+import instrumentation
+from instrumentation import count_scenarios, stage
+
+
+# One cache per server process, shared by every session. Point GREEN_STEEL_CACHE_DIR at a shared
+# directory to let all worker processes reuse each other's results.
+@st.cache_resource
+def get_result_cache():
+    cache = ResultCache(
+        max_entries=int(os.environ.get('GREEN_STEEL_CACHE_ENTRIES', 256)),
+        directory=os.environ.get('GREEN_STEEL_CACHE_DIR'),
+        max_disk_bytes=int(os.environ.get('GREEN_STEEL_CACHE_DISK_MB', 1024)) * 2 ** 20,
+    )
+    instrumentation.watch_cache(cache)
+    return cache
+
+
+def cached(namespace, parameters, compute, **options):
+    key = parameters_key([parameters, options], namespace)
+    return get_result_cache().get_or_compute(key, compute, lambda hit: instrumentation.count_cache_lookup(namespace, hit))
+
+
+# Monte Carlo chunks run in this many worker processes, forked from the server for each run that
+# isn't cached; each holds one chunk of draws in memory
+MONTE_CARLO_WORKERS = int(os.environ.get('GREEN_STEEL_MONTE_CARLO_WORKERS', 2))
+
+
+# Stage timings and counters are only collected when GREEN_STEEL_METRICS_PORT is set, which also
+# serves them for Prometheus on that port (give each server process its own port), or while a
+# session has the debug panel open.
+@st.cache_resource
+def start_metrics():
+    port = os.environ.get('GREEN_STEEL_METRICS_PORT')
+    if port:
+        instrumentation.enable(int(port))
+
+
+# Price histories and forecasts ingested with price_store.py into GREEN_STEEL_PRICE_STORE. The store is
+# memory-mapped once per server process and shared by every session; a new ingest changes the
+# manifest's modification time, which opens the new version.
+@st.cache_resource(max_entries=1)
+def get_price_store(directory, version):
+    return PriceStore(directory)
+
+
+def show_image(png):
+    # time handing the PNG over to Streamlit's media store, the st.image side of a chart
+    with stage('publish_image'):
+        st.image(png, use_column_width=True)
+
+
+# The cost chart figure lives for the whole session and is updated in place on every rerun
+def get_cost_chart():
+    if 'cost_chart' not in st.session_state:
+        st.session_state['cost_chart'] = CostChart()
+    return st.session_state['cost_chart']
+
+
+# The per-input cost projections of the session's last run, so a slider move only recomputes the
+# inputs it affects
+def get_projection():
+    if 'projection' not in st.session_state:
+        st.session_state['projection'] = IncrementalProjection()
+    return st.session_state['projection']
+
 
 # Define the function for steel production cost calculation
 def calculate_steel_production_costs(
@@ -30,136 +108,300 @@ def calculate_steel_production_costs(
     target_tipping_year,
     ):
     
-    fixed_production = 1000
-    # calculate base costs
-    base_hydrogen_costs = base_hydrogen_units * hydrogen_prices[0]
-    base_electricity_costs = base_electricity_units * electricity_prices[0]
-    base_ironore_costs = base_ironore_units * ironore_prices[0]
-    base_carbon_costs = base_carbon_units * carbon_prices[0]
-    base_labour_costs = base_labour_units * labour_prices[0]
-    
-    # Initialize empty lists for projection
-    other_costs_projection = [base_other_costs]
-    hydrogen_costs_projection = [base_hydrogen_costs]
-    electricity_costs_projection = [base_electricity_costs]
-    ironore_costs_projection = [base_ironore_costs]
-    carbon_costs_projection = [base_carbon_costs]
-    labour_costs_projection = [base_labour_costs]
-
-    # Initialize empty lists for aggregated projections
-    total_costs = []
-    cumulative_production = []
-    costs_per_ton = []
-
-    base_wasted_hydrogen_units = base_hydrogen_units * (1 - raw_material_utilisation)
-    base_wasted_electricity_units = base_electricity_units * (1 - raw_material_utilisation)
-    base_wasted_ironore_units = base_ironore_units * (1 - raw_material_utilisation)
-    base_wasted_carbon_units = base_carbon_units * (1 - raw_material_utilisation)
-    base_wasted_labour_units = base_labour_units * (1 - operational_labour_efficiency)
-
-    # Initialize intersection year to None
-    intersection_year = None
-
-    for i in range(years):
-        if i == 0:
-            total_costs_calculated = (
-                other_costs_projection[i]
-                + hydrogen_costs_projection[i]
-                + electricity_costs_projection[i]
-                + ironore_costs_projection[i]
-                + carbon_costs_projection[i]
-                + labour_costs_projection[i]
-            )
-            costs_per_ton_calculated = total_costs_calculated / fixed_production
+    parameters = {
+        'base_other_costs': base_other_costs,
+        'base_hydrogen_units': base_hydrogen_units,
+        'base_electricity_units': base_electricity_units,
+        'base_ironore_units': base_ironore_units,
+        'base_carbon_units': base_carbon_units,
+        'base_labour_units': base_labour_units,
+        'hydrogen_prices': hydrogen_prices,
+        'electricity_prices': electricity_prices,
+        'ironore_prices': ironore_prices,
+        'carbon_prices': carbon_prices,
+        'labour_prices': labour_prices,
+        'years': years,
+        'raw_material_utilisation': raw_material_utilisation,
+        'operational_labour_efficiency': operational_labour_efficiency,
+        'target_efficiency_hydrogen': target_efficiency_hydrogen,
+        'target_efficiency_electricity': target_efficiency_electricity,
+        'target_efficiency_ironore': target_efficiency_ironore,
+        'target_efficiency_carbon': target_efficiency_carbon,
+        'target_efficiency_labour': target_efficiency_labour,
+        'traditional_price': traditional_price,
+        'target_tipping_year': target_tipping_year,
+    }
+
+    # Render the chart only when this parameter set hasn't been drawn before
+    def render_chart():
+        with stage('projection'):
+            projection = get_projection().update(**stack_parameters([parameters]))
+        count_scenarios('cost_chart', 1)
+
+        costs_per_ton = projection.costs_per_ton[0]
+        intersection_year = int(projection.intersection_year[0])
+        if intersection_year == NO_INTERSECTION:
+            intersection_year = None
+        subsidy = float(projection.subsidy[0])
+
+        with stage('chart_update'):
+            chart = get_cost_chart().update(costs_per_ton, traditional_price, target_tipping_year, subsidy, intersection_year)
+        with stage('chart_png'):
+            return chart.png()
 
-            total_costs.append(total_costs_calculated)
-            cumulative_production.append(fixed_production)
-            costs_per_ton.append(costs_per_ton_calculated)
+    show_image(cached('cost_chart', parameters, render_chart))
 
+
+# Define the function for the Monte Carlo price-uncertainty fan chart
+def plot_monte_carlo_costs(parameters, n_draws, price_volatility, price_correlation):
+    years = parameters['years']
+    traditional_price = parameters['traditional_price']
+    target_tipping_year = parameters['target_tipping_year']
+
+    options = {'n_draws': n_draws, 'price_volatility': price_volatility, 'price_correlation': price_correlation}
+
+    def simulate():
+        with stage('monte_carlo'):
+            summary = run_monte_carlo(parameters, n_draws, price_volatility, price_correlation, workers=MONTE_CARLO_WORKERS)
+        count_scenarios('monte_carlo', n_draws)
+        return summary
+
+    summary = cached('monte_carlo', parameters, simulate, **options)
+
+    def render_chart():
+        title = f'Cost per Ton of Steel Production Over Time ({n_draws:,} price draws, target tipping point in year {target_tipping_year})'
+        with stage('chart_png'):
+            return fan_chart_png(summary.costs_per_ton_quantiles, traditional_price, title)
+
+    show_image(cached('monte_carlo_chart', parameters, render_chart, **options))
+
+    subsidy_p5, subsidy_p50, subsidy_p95 = summary.subsidy_quantiles
+    st.write(
+        f"**Required subsidy in year {target_tipping_year}:** "
+        f"P5 £{round(subsidy_p5, 4)}/ton, P50 £{round(subsidy_p50, 4)}/ton, P95 £{round(subsidy_p95, 4)}/ton"
+    )
+    never = summary.tipping_year_counts.get(NO_INTERSECTION, 0)
+    st.write(f"**Tipping year distribution** ({round(100 * never / n_draws, 2)}% of draws never reach the traditional price)")
+    st.bar_chart(pd.DataFrame(
+        {'Share of draws': [summary.tipping_year_counts.get(year, 0) / n_draws for year in range(years - 1)]},
+        index=pd.Index(range(years - 1), name='Tipping Calendar Year'),
+    ))
+
+
+# Define the function for the key-driver (sensitivity analysis) charts
+def plot_sensitivity_analysis(parameters, sensitivity_output, sobol_samples):
+    options = {'sensitivity_output': sensitivity_output, 'sobol_samples': sobol_samples}
+
+    def run_tornado():
+        with stage('tornado'):
+            result = tornado(parameters, output=sensitivity_output)
+        count_scenarios('tornado', 2 * len(result.bars) + 1)
+        return result
+
+    def run_sobol():
+        with stage('sobol'):
+            result = sobol_indices(parameters, output=sensitivity_output, n=sobol_samples)
+        count_scenarios('sobol', result.n_evaluations)
+        return result
+
+    tornado_result = cached('tornado', parameters, run_tornado, **options)
+    sobol_result = cached('sobol', parameters, run_sobol, **options)
+
+    def render_tornado_chart():
+        with stage('chart_png'):
+            return tornado_chart_png(tornado_result, sensitivity_output.replace('_', ' ').title())
+
+    def render_sobol_chart():
+        with stage('chart_png'):
+            return sobol_chart_png(sobol_result)
+
+    st.write(f"### Key Drivers of {sensitivity_output.replace('_', ' ').title()}")
+    st.write(f"One-at-a-time swing around the base value of {round(tornado_result.base_output, 4)} (each input moved across its range with the rest held at base).")
+    show_image(cached('tornado_chart', parameters, render_tornado_chart, **options))
+
+    st.write(f"Variance-based Sobol indices from {sobol_result.n_evaluations:,} batched model evaluations.")
+    show_image(cached('sobol_chart', parameters, render_sobol_chart, **options))
+
+
+# Define the function for the targets required to tip in the target year
+def show_tipping_year_targets(parameters):
+    target_tipping_year = parameters['target_tipping_year']
+    st.write(f"### Targets Required to Tip in Year {target_tipping_year}")
+
+    def solve():
+        with stage('tipping_year_targets'):
+            return (
+                required_efficiency(parameters)[0],
+                {input_name: break_even_prices(parameters, input_name) for input_name in ['hydrogen', 'electricity']},
+                least_cost_efficiency_mix(parameters),
+            )
+
+    try:
+        shared_efficiency, break_even, mix = cached('tipping_year_targets', parameters, solve)
+    except ValueError as error:
+        st.error(f"The targets can't be solved for: {error}")
+        return
+    if np.isnan(shared_efficiency):
+        st.write("Even a 100% YoY waste efficiency target on every input does not reach the traditional price in this year.")
+    else:
+        st.write(f"**Minimum YoY waste efficiency target shared by all inputs:** {round(100 * shared_efficiency, 2)}%")
+
+    for input_name, unit in [('hydrogen', 'kg'), ('electricity', 'kWh')]:
+        price, multiplier = break_even[input_name].price[0], break_even[input_name].multiplier[0]
+        if price < 0:
+            st.write(f"**Break-even {input_name} price:** no non-negative {input_name} price reaches the traditional price in this year.")
         else:
-            wasted_hydrogen_units = base_wasted_hydrogen_units * (1 - target_efficiency_hydrogen) ** i
-            hydrogen_savings_units = base_wasted_hydrogen_units - wasted_hydrogen_units
-            hydrogen_units_calculated = base_hydrogen_units - hydrogen_savings_units
-            hydrogen_costs_calculated = hydrogen_units_calculated * hydrogen_prices[i]
-            hydrogen_costs_projection.append(hydrogen_costs_calculated)
-
-            wasted_electricity_units = base_wasted_electricity_units * (1 - target_efficiency_electricity) ** i
-            electricity_savings_units = base_wasted_electricity_units - wasted_electricity_units
-            electricity_units_calculated = base_electricity_units - electricity_savings_units
-            electricity_costs_calculated = electricity_units_calculated * electricity_prices[i]
-            electricity_costs_projection.append(electricity_costs_calculated)
-
-            wasted_ironore_units = base_wasted_ironore_units * (1 - target_efficiency_ironore) ** i
-            ironore_savings_units = base_wasted_ironore_units - wasted_ironore_units
-            ironore_units_calculated = base_ironore_units - ironore_savings_units
-            ironore_costs_calculated = ironore_units_calculated * ironore_prices[i]
-            ironore_costs_projection.append(ironore_costs_calculated)
-
-            wasted_carbon_units = base_wasted_carbon_units * (1 - target_efficiency_carbon) ** i
-            carbon_savings_units = base_wasted_carbon_units - wasted_carbon_units
-            carbon_units_calculated = base_carbon_units - carbon_savings_units
-            carbon_costs_calculated = carbon_units_calculated * carbon_prices[i]
-            carbon_costs_projection.append(carbon_costs_calculated)
-
-            wasted_labour_units = base_wasted_labour_units * (1 - target_efficiency_labour) ** i
-            labour_savings_units = base_wasted_labour_units - wasted_labour_units
-            labour_units_calculated = base_labour_units - labour_savings_units
-            labour_costs_calculated = labour_units_calculated * labour_prices[i]
-            labour_costs_projection.append(labour_costs_calculated)
-
-            total_costs_calculated = (
-                base_other_costs
-                + hydrogen_costs_projection[i]
-                + electricity_costs_projection[i]
-                + ironore_costs_projection[i]
-                + carbon_costs_projection[i]
-                + labour_costs_projection[i]
+            st.write(
+                f"**Break-even {input_name} price:** £{round(price, 4)}/{unit} ({round(100 * multiplier, 2)}% of the projected price path)"
             )
-            costs_per_ton_calculated = total_costs_calculated / fixed_production
 
-            total_costs.append(total_costs_calculated)
-            cumulative_production.append(fixed_production)
-            costs_per_ton.append(costs_per_ton_calculated)
-            
-            # Check for intersection with international price
-            if costs_per_ton_calculated <= traditional_price and intersection_year is None:
-                intersection_year = i - 1
+    if mix.feasible[0]:
+        st.write("**Least-cost mix of YoY waste efficiency targets:**")
+        st.table(pd.DataFrame(
+            {'Target Efficiency (%)': [round(100 * e, 2) for e in mix.efficiencies[0]]},
+            index=['Hydrogen', 'Electricity', 'Iron Ore', 'Carbon', 'Labour'],
+        ))
 
-    subsidy = costs_per_ton[target_tipping_year] - traditional_price
-    
-    #####
-    # Matplotlib Code
-    #####
-    # Set the background color to black
-    plt.rcParams['axes.facecolor'] = 'black'
-    # Set the text color to white
-    plt.rcParams['text.color'] = 'white'
-    
-    plt.plot(range(years), [traditional_price] * years, linestyle='--', label='Traditional Price')
-    plt.plot(range(years), costs_per_ton, label='Cost per Ton')
-    min_value = min(costs_per_ton) - 0.1  # Subtract a small value for some padding
-    max_value = max(costs_per_ton) + 0.1  # Add a small value for some padding
-    plt.ylim(min_value, max_value)
-    # plt.ylim(0, 1)  # Set the y-axis minimum to 0
-    plt.xlabel('Years')
-    plt.ylabel('Costs per Ton')
-    plt.title(f'Cost per Ton of Steel Production Over Time (with target tipping point in year {target_tipping_year} and required subsidy)')
-    
-    # Set arrow color to white for all annotations
-    arrow_props = dict(arrowstyle='->', color='white')
-    
-    plt.annotate(f'Required Subsidy: £{round(subsidy, 4)}/ton', xy=(target_tipping_year, costs_per_ton[target_tipping_year]), xytext=(target_tipping_year + 1, costs_per_ton[target_tipping_year] ), arrowprops=arrow_props)
-    # only one line may be specified; ymin & ymax specified as a percentage of y-range
-    plt.axvline(x=target_tipping_year, ymin=traditional_price, ymax=costs_per_ton[target_tipping_year - 1], color='green', ls='--', label='subsidy')
-    
-    if intersection_year is not None:
-        plt.annotate(f'Tipping Calendar Year: {intersection_year}', xy=(intersection_year, traditional_price), xytext=(intersection_year + 1, traditional_price * 1.5), arrowprops=arrow_props)
-    
-    plt.legend()
-    st.pyplot(plt)
+
+INPUT_LABELS = {'hydrogen': 'Hydrogen', 'electricity': 'Electricity', 'ironore': 'Iron Ore', 'carbon': 'Carbon', 'labour': 'Labour'}
+
+
+# Define the function for the efficiency target sweep heatmaps
+def plot_efficiency_sweep(parameters, full_grid, x_input, y_input, grid_steps):
+    target_tipping_year = parameters['target_tipping_year']
+    values = np.linspace(0, 1, grid_steps)
+    options = {'full_grid': full_grid, 'x_input': x_input, 'y_input': y_input, 'grid_steps': grid_steps}
+
+    # keep only the 2-D view of the sweep, a full grid is millions of scenarios
+    def sweep():
+        grid = {name: values for name in (INPUTS if full_grid else (x_input, y_input))}
+        with stage('efficiency_sweep'):
+            result = sweep_efficiency_targets(parameters, grid)
+        count_scenarios('efficiency_sweep', result.tipping_year.size)
+        return best_over_other_targets(result, x_input, y_input) + (result.tipping_year.size,)
+
+    tipping_year, subsidy, n_scenarios = cached('efficiency_sweep', parameters, sweep, **options)
+    xlabel = f'Target Efficiency {INPUT_LABELS[x_input]} (%)'
+    ylabel = f'Target Efficiency {INPUT_LABELS[y_input]} (%)'
+
+    def render_tipping_year_chart():
+        with stage('chart_png'):
+            return heatmap_png(
+                tipping_year, values, values, xlabel, ylabel, 'Tipping Calendar Year', 'Tipping Calendar Year',
+                mask=tipping_year == NO_INTERSECTION,
+            )
+
+    def render_subsidy_chart():
+        with stage('chart_png'):
+            return heatmap_png(subsidy, values, values, xlabel, ylabel, f'Required Subsidy in Year {target_tipping_year}', '£/ton')
+
+    st.write(f"### Efficiency Target Sweep ({n_scenarios:,} scenarios)")
+    if full_grid:
+        st.write("Each cell shows the best outcome over every grid value of the other three targets.")
+    else:
+        st.write("The other three targets are held at their sidebar values.")
+    st.write("Grey cells never reach the traditional price within the projection.")
+    show_image(cached('efficiency_sweep_tipping_chart', parameters, render_tipping_year_chart, **options))
+    show_image(cached('efficiency_sweep_subsidy_chart', parameters, render_subsidy_chart, **options))
+
+
+# Define the function for the fleet of plants in an uploaded plant table
+def plot_portfolio(parameters, plant_table):
+    years = parameters['years']
+    target_tipping_year = parameters['target_tipping_year']
+    options = {'plant_table': hashlib.sha256(plant_table).hexdigest()}
+
+    def project():
+        plants = plants_from_table(pd.read_csv(io.BytesIO(plant_table)), parameters)
+        prices = stack_parameters([parameters])['prices'][0]
+        with stage('portfolio'):
+            projection = project_portfolio(plants, prices, years, parameters['traditional_price'], target_tipping_year)
+        count_scenarios('portfolio', len(plants.capacity))
+        return projection.fleet_costs_per_ton, projection.subsidy_bill, tipping_year_counts(projection), len(plants.capacity), plants.capacity.sum()
+
+    try:
+        fleet_costs_per_ton, subsidy_bill, (counts, never), n_plants, capacity = cached('portfolio', parameters, project, **options)
+    except (KeyError, ValueError, pd.errors.ParserError) as error:
+        st.error(f"The plant table can't be used: {error}")
+        return
+
+    st.write(f"### Plant Portfolio ({n_plants:,} plants, {round(capacity / 1e6, 2)} Mt/year at full capacity)")
+    st.write("Production-weighted cost per ton of the whole fleet, with each plant ramping up from its commissioning year.")
+    st.line_chart(pd.DataFrame(
+        {'Fleet Cost per Ton (£/ton)': fleet_costs_per_ton, 'Traditional Price (£/ton)': parameters['traditional_price']},
+        index=pd.Index(range(years), name='Calendar Year'),
+    ))
+    st.write(f"**Total subsidy bill:** £{round(subsidy_bill.sum(), 2):,} over {years} years, to bring every ton produced down to the traditional price")
+    st.bar_chart(pd.DataFrame({'Subsidy Bill (£)': subsidy_bill}, index=pd.Index(range(years), name='Calendar Year')))
+    st.write(f"**Plants reaching the traditional price by year** ({never:,} of {n_plants:,} never do)")
+    st.bar_chart(pd.DataFrame({'Plants': counts}, index=pd.Index(range(len(counts)), name='Tipping Calendar Year')))
+
+
+# Define the function for the cheapest multi-year subsidy schedule
+def plot_subsidy_schedule(parameters, required_year, budget_cap, discount_rate, never_rises, max_fall, traditional_price_path):
+    years = parameters['years']
+    options = {
+        'required_year': required_year, 'budget_cap': budget_cap, 'discount_rate': discount_rate,
+        'never_rises': never_rises, 'max_fall': max_fall, 'traditional_price_path': traditional_price_path,
+    }
+
+    def optimise():
+        with stage('subsidy_schedule'):
+            return optimal_subsidy_schedule(
+                parameters,
+                required_year,
+                budget_caps=budget_cap if budget_cap > 0 else np.inf,
+                discount_rate=discount_rate,
+                traditional_price=traditional_price_path,
+                max_rise=0.0 if never_rises else np.inf,
+                max_fall=max_fall if max_fall > 0 else np.inf,
+            )
+
+    schedule = cached('subsidy_schedule', parameters, optimise, **options)
+    st.write(f"### Subsidy Schedule for Competitiveness from Year {required_year}")
+    if not schedule.feasible[0]:
+        earliest_year = int(schedule.earliest_year[0])
+        if earliest_year == NO_INTERSECTION:
+            st.warning("The annual budget cap can't keep green steel competitive even in the final year of the projection.")
+        else:
+            st.warning(f"The annual budget cap is exceeded; the earliest year it allows competitiveness from is year {earliest_year}. The schedule below ignores the cap.")
+    st.write(
+        f"**Total spend:** £{round(schedule.spend[0].sum(), 2):,} "
+        f"(£{round(schedule.discounted_spend[0], 2):,} discounted at {round(100 * discount_rate, 2)}% a year)"
+    )
+    st.bar_chart(pd.DataFrame(
+        {'Subsidy (£/ton)': schedule.subsidy[0]},
+        index=pd.Index(range(years), name='Calendar Year'),
+    ))
+
+
+# Define the sidebar panel with this rerun's stage timings and the process-wide totals
+def show_debug_panel():
+    st.sidebar.write("**Stage timings (ms)**")
+    last = instrumentation.last_timings()
+    totals = instrumentation.stage_totals()
+    stages = sorted(set(last) | set(totals), key=lambda name: -last.get(name, 0.0))
+    st.sidebar.dataframe(pd.DataFrame(
+        {
+            'This rerun': [round(1e3 * last.get(name, 0.0), 2) for name in stages],
+            'Count': [totals.get(name, (0, 0.0))[0] for name in stages],
+            'Mean': [round(1e3 * totals[name][1] / totals[name][0], 2) if totals.get(name, (0,))[0] else 0.0 for name in stages],
+        },
+        index=pd.Index(stages, name='Stage'),
+    ))
+    scenarios = instrumentation.counter_totals(instrumentation.SCENARIO_EVALUATIONS)
+    st.sidebar.write("**Scenario evaluations:** " + (", ".join(f"{source} {int(n):,}" for (source,), n in sorted(scenarios.items())) or "none"))
+    stats = get_result_cache().stats()
+    st.sidebar.write(
+        f"**Result cache:** {stats.hits:,} hits, {stats.disk_hits:,} disk hits, {stats.misses:,} misses, "
+        f"{stats.entries:,} entries ({round(stats.bytes / 2 ** 20, 1)} MB)"
+    )
 
 
 # Streamlit UI
+start_metrics()
+instrumentation.begin_rerun(debug=st.session_state.get('debug_panel', False))
+
 st.title("Green Steel Production Cost Calculator")
 
 st.warning(
@@ -220,21 +462,118 @@ base_labour_units = st.sidebar.number_input("Base Labour Units (hours)", value=5
 # Add a gap above the "Exogenous Price Projections" title
 st.sidebar.markdown("&nbsp;")
 st.sidebar.write("### **Exogenous Price Projections**")
-hydrogen_prices = st.sidebar.text_area("Hydrogen Prices (£/kg) separated by comma", "10,9,9,8,8,8,8,8,8,8")
-hydrogen_prices = [float(price) for price in hydrogen_prices.split(",")]
-electricity_prices = st.sidebar.text_area("Electricity Prices (£/kWh) separated by comma", "15,15,13,13,14,14,13,13,13,13")
-electricity_prices = [float(price) for price in electricity_prices.split(",")]
-ironore_prices = st.sidebar.text_area("Iron Ore Prices (£/kg) separated by comma", "4,4,5,5,6,4,3,4,3,3")
-ironore_prices = [float(price) for price in ironore_prices.split(",")]
-carbon_prices = st.sidebar.text_area("Carbon Prices (£/kg) separated by comma", "7,8,8,8,9,9,9,9,9,9")
-carbon_prices = [float(price) for price in carbon_prices.split(",")]
-labour_prices = st.sidebar.text_area("Labour Prices (£/hour) separated by comma", "16,17,18,18,18,20,20,20,20,22")
-labour_prices = [float(price) for price in labour_prices.split(",")]
+price_store_directory = os.environ.get('GREEN_STEEL_PRICE_STORE')
+use_price_store = bool(price_store_directory) and st.sidebar.checkbox("Use the stored price histories and forecasts", value=True)
+if use_price_store:
+    price_store = get_price_store(price_store_directory, manifest_mtime(price_store_directory))
+    try:
+        first_year, last_year = (int(str(year)) for year in price_store.common_periods('annual'))
+    except ValueError as error:
+        st.error(f"The price store can't be used: {error}")
+        st.stop()
+    st.sidebar.write(f"Annual average prices, available from {first_year} to {last_year}.")
+    price_store_start = st.sidebar.number_input("First Projection Year", min_value=first_year, max_value=last_year, value=first_year)
+else:
+    hydrogen_prices = st.sidebar.text_area("Hydrogen Prices (£/kg) separated by comma", "10,9,9,8,8,8,8,8,8,8")
+    electricity_prices = st.sidebar.text_area("Electricity Prices (£/kWh) separated by comma", "15,15,13,13,14,14,13,13,13,13")
+    ironore_prices = st.sidebar.text_area("Iron Ore Prices (£/kg) separated by comma", "4,4,5,5,6,4,3,4,3,3")
+    carbon_prices = st.sidebar.text_area("Carbon Prices (£/kg) separated by comma", "7,8,8,8,9,9,9,9,9,9")
+    labour_prices = st.sidebar.text_area("Labour Prices (£/hour) separated by comma", "16,17,18,18,18,20,20,20,20,22")
+    try:
+        with stage('parse_prices'):
+            hydrogen_prices = [float(price) for price in hydrogen_prices.split(",")]
+            electricity_prices = [float(price) for price in electricity_prices.split(",")]
+            ironore_prices = [float(price) for price in ironore_prices.split(",")]
+            carbon_prices = [float(price) for price in carbon_prices.split(",")]
+            labour_prices = [float(price) for price in labour_prices.split(",")]
+    except ValueError as error:
+        st.error(f"Each price projection must be numbers separated by commas ({error}).")
+        st.stop()
 st.sidebar.markdown("&nbsp;")
 st.sidebar.write("### **Model Calibration**")
 years = st.sidebar.number_input("Number of Years", value=10)
 traditional_price = st.sidebar.number_input("Traditional Price (£/ton)", value=0.3)
 target_tipping_year = st.sidebar.number_input("Target Tipping Year", value=1)
+if use_price_store:
+    try:
+        with stage('resample_prices'):
+            resampled = price_store.resample('annual', start=price_store_start, periods=years)
+    except ValueError as error:
+        st.error(f"The price store can't provide {years} years from {price_store_start}: {error}")
+        st.stop()
+    hydrogen_prices, electricity_prices, ironore_prices, carbon_prices, labour_prices = resampled.prices.tolist()
+short_series = [
+    f"{label} ({len(series)} values)"
+    for label, series in [('Hydrogen', hydrogen_prices), ('Electricity', electricity_prices), ('Iron Ore', ironore_prices), ('Carbon', carbon_prices), ('Labour', labour_prices)]
+    if len(series) < years
+]
+if short_series:
+    st.error(f"Each price projection needs at least {years} values, one per year: {', '.join(short_series)} too short.")
+    st.stop()
+st.sidebar.markdown("&nbsp;")
+st.sidebar.write("### **Price Uncertainty (Monte Carlo)**")
+monte_carlo = st.sidebar.checkbox("Sample price paths around the projections", value=False)
+if monte_carlo:
+    n_draws = st.sidebar.number_input("Number of Draws", min_value=1, value=100000, step=10000)
+    price_volatility = st.sidebar.text_area("YoY Price Volatility (hydrogen, electricity, iron ore, carbon, labour) separated by comma", "0.1,0.1,0.05,0.08,0.03")
+    price_correlation = st.sidebar.text_area(
+        "Price Correlation Matrix (one row per line, values separated by comma)",
+        "1,0.6,0,0,0\n0.6,1,0,0,0\n0,0,1,0,0\n0,0,0,1,0\n0,0,0,0,1",
+    )
+    try:
+        price_volatility = [float(volatility) for volatility in price_volatility.split(",")]
+        if len(price_volatility) not in (1, len(INPUTS)) or min(price_volatility) < 0:
+            raise ValueError(f"expected one or {len(INPUTS)} non-negative volatilities, got {len(price_volatility)} values")
+        price_correlation = [[float(value) for value in row.split(",")] for row in price_correlation.strip().splitlines()]
+        if any(len(row) != len(price_correlation) for row in price_correlation):
+            raise ValueError("the correlation matrix must be square")
+        correlation_cholesky(price_correlation)
+    except ValueError as error:
+        st.error(f"The price volatility and correlation matrix can't be used ({error}).")
+        st.stop()
+st.sidebar.markdown("&nbsp;")
+st.sidebar.write("### **Tipping Year Targets**")
+tipping_year_targets = st.sidebar.checkbox("Solve for the targets that tip in the target year", value=False)
+st.sidebar.markdown("&nbsp;")
+st.sidebar.write("### **Sensitivity Analysis**")
+sensitivity_analysis = st.sidebar.checkbox("Show key drivers (tornado and Sobol indices)", value=False)
+if sensitivity_analysis:
+    sensitivity_output = st.sidebar.selectbox("Sensitivity Output", list(SENSITIVITY_OUTPUTS))
+    sobol_samples = st.sidebar.select_slider("Sobol Base Samples", options=[256, 512, 1024, 2048, 4096], value=1024)
+
+st.sidebar.markdown("&nbsp;")
+st.sidebar.write("### **Efficiency Target Sweep**")
+efficiency_sweep = st.sidebar.checkbox("Sweep the waste efficiency targets (tipping year and subsidy heatmaps)", value=False)
+if efficiency_sweep:
+    full_grid = st.sidebar.radio("Sweep", ["2-D slice", "Full grid"]) == "Full grid"
+    input_names = {label: name for name, label in INPUT_LABELS.items()}
+    x_input = input_names[st.sidebar.selectbox("Heatmap X Axis", list(input_names), index=0)]
+    y_input = input_names[st.sidebar.selectbox("Heatmap Y Axis", list(input_names), index=1)]
+    grid_steps = st.sidebar.slider("Grid Steps per Target", 2, 21, 11)
+st.sidebar.markdown("&nbsp;")
+st.sidebar.write("### **Subsidy Schedule**")
+subsidy_schedule = st.sidebar.checkbox("Find the cheapest subsidy schedule over the years", value=False)
+if subsidy_schedule:
+    required_year = st.sidebar.number_input("Required Competitiveness Year", min_value=0, max_value=max(years - 1, 0), value=min(max(target_tipping_year, 0), max(years - 1, 0)))
+    budget_cap = st.sidebar.number_input("Annual Budget Cap (£, 0 for none)", min_value=0.0, value=0.0)
+    discount_rate = st.sidebar.number_input("Discount Rate", min_value=0.0, value=0.035, step=0.005, format="%.3f")
+    never_rises = st.sidebar.checkbox("Subsidy never rises from one year to the next", value=True)
+    max_fall = st.sidebar.number_input("Largest Yearly Fall in Subsidy (£/ton, 0 for none)", min_value=0.0, value=0.0)
+    traditional_price_path = st.sidebar.text_area("Traditional Price Path (£/ton) separated by comma, blank for the constant price", "")
+    try:
+        traditional_price_path = [float(price) for price in traditional_price_path.split(",")] if traditional_price_path.strip() else None
+    except ValueError as error:
+        st.error(f"The traditional price path must be numbers separated by commas ({error}).")
+        st.stop()
+    if traditional_price_path is not None and len(traditional_price_path) < years:
+        st.error(f"The traditional price path needs at least {years} values, one per year ({len(traditional_price_path)} given).")
+        st.stop()
+st.sidebar.markdown("&nbsp;")
+st.sidebar.write("### **Plant Portfolio**")
+plant_table = st.sidebar.file_uploader("Plant table (CSV, one row per plant)", type=['csv'])
+st.sidebar.markdown("&nbsp;")
+st.sidebar.write("### **Diagnostics**")
+debug_panel = st.sidebar.checkbox("Show stage timings and cache statistics", value=False, key='debug_panel')
 
 st.sidebar.button("Calculate Steel Production Costs")
 
@@ -262,7 +601,28 @@ if base_hydrogen_units and base_electricity_units and base_carbon_units and base
         'traditional_price': traditional_price,
         'target_tipping_year': target_tipping_year,
     }
-    calculate_steel_production_costs(**parameters)
+    if monte_carlo:
+        plot_monte_carlo_costs(parameters, n_draws, price_volatility, price_correlation)
+    else:
+        calculate_steel_production_costs(**parameters)
+
+    if tipping_year_targets:
+        show_tipping_year_targets(parameters)
+
+    if sensitivity_analysis:
+        plot_sensitivity_analysis(parameters, sensitivity_output, sobol_samples)
+
+    if efficiency_sweep:
+        if x_input == y_input:
+            st.warning("Choose two different targets for the efficiency sweep heatmap axes.")
+        else:
+            plot_efficiency_sweep(parameters, full_grid, x_input, y_input, grid_steps)
+
+    if subsidy_schedule:
+        plot_subsidy_schedule(parameters, required_year, budget_cap, discount_rate, never_rises, max_fall, traditional_price_path)
+
+    if plant_table is not None:
+        plot_portfolio(parameters, plant_table.getvalue())
 
     st.write("This is a Steel Production Cost Calculator. Enter your input parameters in the sidebar, and the app will calculate and display the cost per ton of steel production over time.")
 
@@ -390,6 +750,12 @@ if base_hydrogen_units and base_electricity_units and base_carbon_units and base
             - Labour Prices
             Definition: The price movements of average wages.
 
+        - **Stored Price Histories and Forecasts**
+        *Available when the app is started with GREEN_STEEL_PRICE_STORE pointing at a price store (see price_store.py). Hourly, daily or monthly prices of all five inputs are averaged over each calendar year and used instead of the typed series.*
+
+            - First Projection Year
+            Definition: The calendar year that becomes year 0 of the projection. Every input must have prices covering each year of the projection.
+
         - **Model Calibration**
         *This sets the projection of the model, the traditional price benchmark (that defines cost competitivity), 
         and the target tipping year (which defines the required government subsidy to support the targeted cost competitivity)
@@ -401,6 +767,86 @@ if base_hydrogen_units and base_electricity_units and base_carbon_units and base
             Definition: This defines the cost competitivity benchmark. This can be the international price of Steel or that which is produced by the country.
             Assumption: This model assumes that steel producers are price takers not price setters, and that the international steel price doesn't move.
             Limitation: This is a very broad assumption used for model simplification in version 1.
+
+        - **Price Uncertainty (Monte Carlo)**
+        *When enabled, the chart shows a fan of outcomes instead of a single cost curve.*
+
+            - Number of Draws
+            Definition: How many price paths are sampled around the exogenous price projections.
+
+            - YoY Price Volatility
+            Definition: The standard deviation of the yearly lognormal price shock for each input. Shocks accumulate over the years and are centred on the projected price.
+
+            - Price Correlation Matrix
+            Definition: The correlation between the yearly price shocks of the five inputs, in the order hydrogen, electricity, iron ore, carbon, labour.
+
+        - **Tipping Year Targets**
+        *Works backwards from the target tipping year: what would have to be true for the required subsidy in that year to be zero.*
+
+            - Minimum Shared Efficiency Target
+            Definition: The smallest YoY waste efficiency target which, applied to every input, brings the cost per ton down to the traditional price in the target year.
+
+            - Break-even Hydrogen and Electricity Prices
+            Definition: The highest price of that input in the target year at which the cost per ton still meets the traditional price, all else unchanged.
+
+            - Least-cost Mix
+            Definition: The combination of the five efficiency targets with the smallest total squared effort that meets the traditional price in the target year.
+
+        - **Sensitivity Analysis**
+        *Ranks which inputs drive the chosen output. Efficiencies and utilisation rates are moved by +/- 0.1, all other inputs (including each whole price series) by +/- 20%.*
+
+            - Tornado Chart
+            Definition: The change in the output when one input is moved to the bottom or top of its range with every other input held at its base value.
+
+            - Sobol Indices
+            Definition: The share of the output's variance explained by each input on its own (first order) and including its interactions with other inputs (total).
+
+        - **Efficiency Target Sweep**
+        *Evaluates every combination of waste efficiency targets on a grid from 0% to 100%, instead of one slider setting at a time.*
+
+            - 2-D Slice
+            Definition: Sweeps the two targets on the heatmap axes, with the other three held at their sidebar values.
+
+            - Full Grid
+            Definition: Sweeps all five targets (21 steps is over 4 million scenarios); each heatmap cell shows the earliest tipping year and lowest subsidy reachable with any values of the other three.
+
+        - **Subsidy Schedule**
+        *Instead of the subsidy in the target tipping year alone, finds the subsidy per ton in every year with the lowest total spend that keeps green steel at or below the traditional price from the required year onwards.*
+
+            - Required Competitiveness Year
+            Definition: The first year from which the subsidised cost per ton must be at or below the traditional price, every year to the end of the projection.
+
+            - Annual Budget Cap
+            Definition: The most that may be spent in any one year, for the 1,000 tons produced a year. When the cap is too low, the earliest required year it allows is shown instead.
+
+            - Discount Rate
+            Definition: The yearly rate at which future spending is discounted in the total.
+
+            - Subsidy Never Rises and Largest Yearly Fall
+            Definition: Limits on how the subsidy per ton may change from one year to the next, so that it phases out steadily rather than following every movement in input prices.
+
+            - Traditional Price Path
+            Definition: An optional traditional price for each year, e.g. rising with a carbon price, used instead of the constant traditional price.
+
+        - **Plant Portfolio**
+        *Upload a CSV with one row per plant to project a whole fleet with the sidebar's price projections, traditional price and target tipping year.*
+
+            - Plant Table Columns
+            Definition: capacity (tons per year at full output) is required. commissioning_year (the projection year the plant starts producing, negative for a plant already running, default 0), ramp_start (share of capacity produced in that year, default 1) and ramp_years (years to reach full output, default 0) describe the production ramp. Any of the base year input values, base year efficiency values and waste efficiency targets can be given per plant with the names used in the batch runner (e.g. base_hydrogen_units, raw_material_utilisation, target_efficiency_carbon); missing columns and blank cells take the sidebar values.
+            Assumption: Waste efficiency gains start when a plant is commissioned, and a plant's cost per ton doesn't depend on its size or how far it has ramped up.
+
+            - Fleet Cost per Ton
+            Definition: The cost per ton of every plant producing that year, weighted by its production.
+
+            - Total Subsidy Bill
+            Definition: The cost of paying every ton produced by a plant above the traditional price down to it, summed over the plants and years.
+
+        - **Diagnostics**
+        *Shows where the time of each rerun goes (parsing the price series, the projection, drawing and encoding the chart, handing it to the page), how many scenarios have been evaluated and how often results came from the cache.*
         
         """
     )
+
+instrumentation.end_rerun()
+if debug_panel:
+    show_debug_panel()
@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+
+from cost_engine import (
+    FIXED_PRODUCTION,
+    INPUTS,
+    CostProjection,
+    find_intersection_year,
+    project_costs,
+    project_input_costs,
+    subsidy_at,
+    sum_input_costs,
+    waste_fractions,
+)
+
+# Below this many (scenario, input, year) costs a full project_costs is quicker than working out
+# what changed, so smaller projections are recomputed whole
+MIN_INCREMENTAL_ELEMENTS = 20_000
+
+
+class IncrementalProjection:
+    """project_costs that keeps the last run's per-input cost projections and reuses what hasn't changed.
+
+    ``update`` takes the same arguments as project_costs and returns the same CostProjection. Each
+    input's cost column depends only on that input's base units, price series, waste fraction and
+    efficiency target, so only the columns whose dependencies changed are recomputed; totals,
+    intersection year and subsidy are redone only when something they depend on changed. Totals
+    are re-summed from the cached columns in the original order rather than patched with the new
+    minus the old column, which would drift from a full projection by rounding over many updates.
+
+    The per-input projections are kept in one array that later updates overwrite in place, so the
+    ``input_costs`` of a returned projection is only valid until the next update. Projections
+    smaller than MIN_INCREMENTAL_ELEMENTS, such as the app's single scenario over a few decades, are
+    always recomputed whole.
+    """
+
+    def __init__(self):
+        self.projection = None
+        # names of the inputs whose cost columns the last update recomputed
+        self.recomputed_inputs = ()
+        self._dependencies = {}
+
+    def _changed(self, name, value):
+        value = np.asarray(value)
+        previous = self._dependencies.get(name)
+        if previous is not None and previous.shape == value.shape and np.array_equal(previous, value):
+            return False
+        # a copy, so that callers mutating their arrays afterwards can't hide a change
+        self._dependencies[name] = value.copy()
+        return True
+
+    def _changed_inputs(self, name, value, input_axis):
+        # which inputs' slices of ``value`` differ from the last update, in one comparison
+        value = np.asarray(value)
+        previous = self._dependencies.get(name)
+        if previous is None or previous.shape != value.shape:
+            self._dependencies[name] = value.copy()
+            return np.ones(len(INPUTS), dtype=bool)
+        differs = previous != value
+        axes = tuple(axis for axis in range(value.ndim) if axis != value.ndim + input_axis)
+        changed = differs.any(axis=axes)
+        if changed.any():
+            np.copyto(previous, value)
+        return changed
+
+    def update(
+        self,
+        base_other_costs,
+        base_units,
+        prices,
+        years,
+        raw_material_utilisation,
+        operational_labour_efficiency,
+        target_efficiencies,
+        traditional_price,
+        target_tipping_year,
+        ):
+        base_units = np.asarray(base_units, dtype=float)
+        prices = np.asarray(prices, dtype=float)
+        target_efficiencies = np.asarray(target_efficiencies, dtype=float)
+        if prices.shape[-1] < years:
+            raise ValueError(f'price series have {prices.shape[-1]} values but {years} years were requested')
+        prices = prices[..., :years]
+        shape = np.broadcast_shapes(
+            base_units.shape + (1,),
+            np.shape(raw_material_utilisation) + (1, 1),
+            np.shape(operational_labour_efficiency) + (1, 1),
+            target_efficiencies.shape + (years,),
+            prices.shape,
+        )
+
+        # cleared until this update completes, so a failed update leads to a full recompute next time
+        previous, self.projection = self.projection, None
+        if math.prod(shape) < MIN_INCREMENTAL_ELEMENTS:
+            self._dependencies = {}
+            self.recomputed_inputs = INPUTS
+            self.projection = project_costs(
+                base_other_costs,
+                base_units,
+                prices,
+                years,
+                raw_material_utilisation,
+                operational_labour_efficiency,
+                target_efficiencies,
+                traditional_price,
+                target_tipping_year,
+            )
+            return self.projection
+
+        wasted_fraction = waste_fractions(raw_material_utilisation, operational_labour_efficiency)
+        new_shape = self._changed('shape', shape)
+        changed = (
+            self._changed_inputs('base_units', base_units, -1)
+            | self._changed_inputs('prices', prices, -2)
+            | self._changed_inputs('wasted_fraction', wasted_fraction, -1)
+            | self._changed_inputs('target_efficiencies', target_efficiencies, -1)
+        )
+        changed = list(np.flatnonzero(changed))
+        if previous is None or new_shape:
+            changed = list(range(len(INPUTS)))
+            input_costs = project_input_costs(base_units, prices, wasted_fraction, target_efficiencies, years)
+        else:
+            input_costs = previous.input_costs
+            for k in changed:
+                column = slice(k, k + 1)
+                input_costs[..., column, :] = project_input_costs(
+                    base_units[..., column],
+                    prices[..., column, :],
+                    wasted_fraction[..., column],
+                    target_efficiencies[..., column],
+                    years,
+                )
+
+        other_costs_changed = self._changed('base_other_costs', base_other_costs)
+        if previous is None or changed or other_costs_changed:
+            total_costs = sum_input_costs(base_other_costs, input_costs)
+            costs_per_ton = total_costs / FIXED_PRODUCTION
+        else:
+            total_costs, costs_per_ton = previous.total_costs, previous.costs_per_ton
+        costs_changed = total_costs is not getattr(previous, 'total_costs', None)
+
+        price_changed = self._changed('traditional_price', traditional_price)
+        tipping_year_changed = self._changed('target_tipping_year', target_tipping_year)
+        if costs_changed or price_changed:
+            intersection_year = find_intersection_year(costs_per_ton, traditional_price)
+        else:
+            intersection_year = previous.intersection_year
+        if costs_changed or price_changed or tipping_year_changed:
+            subsidy = subsidy_at(costs_per_ton, traditional_price, target_tipping_year)
+        else:
+            subsidy = previous.subsidy
+
+        self.recomputed_inputs = tuple(INPUTS[k] for k in changed)
+        self.projection = CostProjection(input_costs, total_costs, costs_per_ton, intersection_year, subsidy)
+        return self.projection
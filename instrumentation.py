@@ -0,0 +1,145 @@
+"""Stage timings and counters for the app, exported as Prometheus metrics.
+
+Timing is off unless ``enable`` has been called (the app does so when GREEN_STEEL_METRICS_PORT is
+set, and serves /metrics on that port) or the current rerun has the debug panel open. While it is
+off, ``stage`` hands back one shared no-op context manager and the counters are left alone, so the
+instrumented hot path costs a function call and an attribute lookup.
+"""
+import contextlib
+import threading
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, ProcessCollector, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+
+# From a cached rerun (milliseconds) to a large Monte Carlo run or Sobol analysis (a minute)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    'green_steel_stage_seconds', 'Wall time spent in each stage of a rerun', ['stage'], buckets=STAGE_BUCKETS, registry=REGISTRY
+)
+SCENARIO_EVALUATIONS = Counter(
+    'green_steel_scenario_evaluations', 'Scenarios evaluated by the cost engine', ['source'], registry=REGISTRY
+)
+CACHE_LOOKUPS = Counter(
+    'green_steel_cache_lookups', 'Result cache lookups by what was looked up and whether it was found', ['namespace', 'result'], registry=REGISTRY
+)
+
+_enabled = False
+_DISABLED = contextlib.nullcontext()
+# Streamlit runs each session's script in its own thread, so per-rerun state is thread-local
+_rerun = threading.local()
+
+
+class CacheCollector:
+    """Reports a ResultCache's own statistics (memory and disk tiers, evictions, size) at scrape time."""
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def collect(self):
+        if self.cache is None:
+            return
+        stats = self.cache.stats()
+        requests = CounterMetricFamily('green_steel_result_cache_requests', 'Result cache requests by tier', labels=['result'])
+        requests.add_metric(['memory_hit'], stats.hits)
+        requests.add_metric(['disk_hit'], stats.disk_hits)
+        requests.add_metric(['miss'], stats.misses)
+        yield requests
+        yield CounterMetricFamily('green_steel_result_cache_evictions', 'Entries evicted from the memory tier', value=stats.evictions)
+        yield GaugeMetricFamily('green_steel_result_cache_entries', 'Entries in the memory tier', value=stats.entries)
+        yield GaugeMetricFamily('green_steel_result_cache_bytes', 'Pickled size of the memory tier', value=stats.bytes)
+
+
+_cache_collector = CacheCollector()
+REGISTRY.register(_cache_collector)
+
+
+def enable(port=None):
+    """Time every rerun from now on, and serve the metrics over HTTP on ``port`` if given."""
+    global _enabled
+    _enabled = True
+    if port is not None:
+        start_http_server(port, registry=REGISTRY)
+
+
+def watch_cache(cache):
+    # a replaced cache (e.g. after st.cache_resource.clear()) takes over the same metric names
+    _cache_collector.cache = cache
+
+
+def begin_rerun(debug=False):
+    """Start a rerun; with ``debug`` its stage timings are kept for ``last_timings`` even if disabled."""
+    _rerun.timings = {} if debug else None
+    _rerun.start = time.perf_counter()
+
+
+def end_rerun():
+    if is_active():
+        _record('rerun', time.perf_counter() - _rerun.start)
+
+
+def is_active():
+    return _enabled or getattr(_rerun, 'timings', None) is not None
+
+
+def _record(name, elapsed):
+    STAGE_SECONDS.labels(name).observe(elapsed)
+    timings = getattr(_rerun, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + elapsed
+
+
+@contextlib.contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def stage(name):
+    """Context manager timing one stage of the rerun into green_steel_stage_seconds{stage=name}."""
+    return _timed(name) if is_active() else _DISABLED
+
+
+def count_scenarios(source, n):
+    if is_active():
+        SCENARIO_EVALUATIONS.labels(source).inc(n)
+
+
+def count_cache_lookup(namespace, hit):
+    if is_active():
+        CACHE_LOOKUPS.labels(namespace, 'hit' if hit else 'miss').inc()
+
+
+def last_timings():
+    """Seconds per stage of the current rerun, when it was started with ``debug``."""
+    return dict(getattr(_rerun, 'timings', None) or {})
+
+
+def stage_totals():
+    """Observation count and total seconds per stage for this process, from the histogram."""
+    totals = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            count, seconds = totals.get(sample.labels['stage'], (0, 0.0))
+            if sample.name.endswith('_count'):
+                totals[sample.labels['stage']] = (int(sample.value), seconds)
+            elif sample.name.endswith('_sum'):
+                totals[sample.labels['stage']] = (count, sample.value)
+    return totals
+
+
+def counter_totals(counter):
+    """Totals of a labelled counter for this process, keyed by label values."""
+    return {
+        tuple(sample.labels.values()): sample.value
+        for metric in counter.collect()
+        for sample in metric.samples
+        if sample.name.endswith('_total')
+    }
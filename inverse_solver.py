@@ -0,0 +1,177 @@
+from collections import namedtuple
+
+import numpy as np
+
+from cost_engine import FIXED_PRODUCTION, INPUTS, stack_parameters, waste_fractions
+
+BreakEvenPrice = namedtuple('BreakEvenPrice', ['price', 'multiplier'])
+EfficiencyMix = namedtuple('EfficiencyMix', ['efficiencies', 'effort', 'feasible'])
+
+# Closed-form cost terms of every scenario in its target year, flattened to (scenarios, inputs)
+TargetYearTerms = namedtuple(
+    'TargetYearTerms',
+    ['base_other_costs', 'base_units', 'wasted_units', 'prices', 'tipping_year', 'traditional_price', 'efficiencies'],
+)
+
+
+def target_year_terms(parameters, target_tipping_year=None):
+    """Per-input terms of the cost per ton in the target tipping year for one or many parameter sets.
+
+    ``target_tipping_year`` overrides the value in the parameters and may be an array of years, in
+    which case every parameter set is solved for every year. Negative years count from the end.
+    """
+    parameter_sets = [parameters] if isinstance(parameters, dict) else list(parameters)
+    batch = stack_parameters(parameter_sets)
+    years = batch['years']
+    if target_tipping_year is None:
+        tipping_year = batch['target_tipping_year']
+    else:
+        tipping_year = np.asarray(target_tipping_year, dtype=int)
+        tipping_year = np.broadcast_to(tipping_year, np.broadcast_shapes(tipping_year.shape, (len(parameter_sets),)))
+    if np.any((tipping_year < -years) | (tipping_year >= years)):
+        raise ValueError(f'target tipping year must be between {-years} and {years - 1}')
+    # negative years count back from the last year, as in subsidy_at
+    tipping_year = tipping_year % years
+    n = tipping_year.shape[0]
+
+    def expand(value):
+        return np.broadcast_to(value, (n,) + value.shape[1:])
+
+    base_units = expand(batch['base_units'])
+    wasted_units = base_units * expand(waste_fractions(batch['raw_material_utilisation'], batch['operational_labour_efficiency']))
+    prices = np.take_along_axis(expand(batch['prices']), tipping_year[:, None, None], axis=-1)[..., 0]
+    return TargetYearTerms(
+        base_other_costs=expand(batch['base_other_costs']),
+        base_units=base_units,
+        wasted_units=wasted_units,
+        prices=prices,
+        tipping_year=tipping_year,
+        traditional_price=expand(batch['traditional_price']),
+        efficiencies=expand(batch['target_efficiencies']),
+    )
+
+
+def cost_per_ton_at(terms, efficiencies):
+    """Cost per ton in the target year: ``other + sum((units - wasted * (1 - (1 - e) ** T)) * price)``."""
+    decay = (1 - efficiencies) ** terms.tipping_year[:, None]
+    units = terms.base_units - terms.wasted_units * (1 - decay)
+    return (terms.base_other_costs + (units * terms.prices).sum(axis=-1)) / FIXED_PRODUCTION
+
+
+def cost_per_ton_gradient(terms, efficiencies):
+    """Partial derivatives of cost_per_ton_at with respect to each input's efficiency."""
+    t = terms.tipping_year[:, None]
+    # T * (1 - e) ** (T - 1), written so that T = 0 gives 0 rather than 0 * inf
+    slope = np.where(t > 0, t * (1 - efficiencies) ** np.maximum(t - 1, 0), 0.0)
+    return -terms.wasted_units * slope * terms.prices / FIXED_PRODUCTION
+
+
+def required_efficiency(parameters, inputs=INPUTS, target_tipping_year=None, tolerance=1e-12, max_iterations=100):
+    """Minimum YoY waste-efficiency target, shared by ``inputs``, for zero subsidy in the target year.
+
+    The other inputs keep the efficiency targets in ``parameters``. Returns 0 where the target is
+    already met and NaN where even a target of 1 cannot reach the traditional price. Cost per ton
+    is convex and decreasing in the shared target, so Newton steps from 0 approach the root from
+    below without overshooting.
+    """
+    terms = target_year_terms(parameters, target_tipping_year)
+    mask = np.isin(INPUTS, inputs)
+
+    def with_target(e):
+        return np.where(mask, e[:, None], terms.efficiencies)
+
+    def excess(e):
+        return cost_per_ton_at(terms, with_target(e)) - terms.traditional_price
+
+    e = np.zeros(len(terms.tipping_year))
+    feasible = excess(np.ones_like(e)) <= 0
+    for _ in range(max_iterations):
+        f = excess(e)
+        slope = (cost_per_ton_gradient(terms, with_target(e)) * mask).sum(axis=-1)
+        active = (f > tolerance) & (slope < 0) & feasible
+        if not active.any():
+            break
+        e = np.where(active, np.minimum(e - f / np.where(active, slope, -1.0), 1.0), e)
+    return np.where(feasible, e, np.nan)
+
+
+def break_even_prices(parameters, input_name, target_tipping_year=None):
+    """Highest price of one input in the target year that still gives zero subsidy.
+
+    Cost per ton is linear in each price, so this is closed form. ``multiplier`` is the break-even
+    price relative to the projected one, i.e. the scaling of that input's price path that tips
+    exactly in the target year.
+    """
+    terms = target_year_terms(parameters, target_tipping_year)
+    k = INPUTS.index(input_name)
+    decay = (1 - terms.efficiencies) ** terms.tipping_year[:, None]
+    units = terms.base_units - terms.wasted_units * (1 - decay)
+    other_costs = terms.base_other_costs + np.delete(units * terms.prices, k, axis=-1).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price = (terms.traditional_price * FIXED_PRODUCTION - other_costs) / units[:, k]
+        multiplier = price / terms.prices[:, k]
+    return BreakEvenPrice(price, multiplier)
+
+
+def _bisect_increasing(f, low, high, iterations=64):
+    # vectorized bisection for the root of an increasing function with f(low) <= 0 <= f(high)
+    for _ in range(iterations):
+        middle = 0.5 * (low + high)
+        below = f(middle) < 0
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+    return 0.5 * (low + high)
+
+
+def least_cost_efficiency_mix(parameters, weights=None, target_tipping_year=None, iterations=64):
+    """Cheapest set of five efficiency targets that gives zero subsidy in the target year.
+
+    Minimises the effort ``sum(w_k * e_k ** 2)`` subject to the target-year cost per ton being at
+    the traditional price. Both are convex in the targets, so the KKT conditions
+    ``2 w_k e_k = -lambda * dcost/de_k`` are sufficient: each e_k(lambda) is found by Newton's
+    method and lambda is then bisected until the cost constraint binds.
+    """
+    terms = target_year_terms(parameters, target_tipping_year)
+    n = len(terms.tipping_year)
+    weights = np.broadcast_to(np.ones(len(INPUTS)) if weights is None else np.asarray(weights, dtype=float), (n, len(INPUTS)))
+    if np.any(weights <= 0):
+        raise ValueError('effort weights must be positive')
+
+    # stationarity 2 w e - lambda * a * T * (1 - e) ** (T - 1) = 0, with a = wasted * price / production
+    t = terms.tipping_year[:, None]
+    scale = terms.wasted_units * terms.prices / FIXED_PRODUCTION
+
+    def targets_for(multiplier):
+        pull = multiplier[:, None] * scale * t
+        e = np.zeros((n, len(INPUTS)))
+        # concave and increasing in e, so Newton steps from 0 approach the root without overshooting
+        for _ in range(iterations):
+            decay = np.where(t > 0, (1 - e) ** np.maximum(t - 1, 0), 0.0)
+            curvature = np.where(t > 1, (t - 1) * (1 - e) ** np.maximum(t - 2, 0), 0.0)
+            residual = 2 * weights * e - pull * decay
+            updated = np.minimum(e - residual / (2 * weights + pull * curvature), 1.0)
+            converged = np.all(np.abs(updated - e) <= 1e-15)
+            e = updated
+            if converged:
+                break
+        return e
+
+    def excess(multiplier):
+        return cost_per_ton_at(terms, targets_for(multiplier)) - terms.traditional_price
+
+    zero = np.zeros((n, len(INPUTS)))
+    already_met = cost_per_ton_at(terms, zero) <= terms.traditional_price
+    feasible = cost_per_ton_at(terms, np.ones_like(zero)) <= terms.traditional_price
+
+    # grow the multiplier until the constraint is met, then bisect back onto it
+    high = np.ones(n)
+    for _ in range(200):
+        short = feasible & ~already_met & (excess(high) > 0)
+        if not short.any():
+            break
+        high = np.where(short, high * 2, high)
+    multiplier = _bisect_increasing(lambda m: -excess(m), np.zeros(n), high, iterations)
+
+    efficiencies = np.where(already_met[:, None], 0.0, targets_for(multiplier))
+    efficiencies = np.where(feasible[:, None], efficiencies, np.nan)
+    return EfficiencyMix(efficiencies, (weights * efficiencies ** 2).sum(axis=-1), feasible)
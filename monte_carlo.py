@@ -0,0 +1,245 @@
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from cost_engine import INPUTS, NO_INTERSECTION, project_costs, stack_parameters
+
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+# (draw, input, year) elements per chunk; a chunk's price paths and per-input costs are a few
+# arrays of this many floats, about 20 MB each, whatever the horizon
+CHUNK_ELEMENTS = 2_500_000
+
+MonteCarloSummary = namedtuple(
+    'MonteCarloSummary',
+    [
+        'n_draws',
+        'quantiles',
+        'costs_per_ton_quantiles',
+        'mean_costs_per_ton',
+        'tipping_year_counts',
+        'subsidy_quantiles',
+        'mean_subsidy',
+        'subsidy_histogram',
+    ],
+)
+
+
+class QuantileHistogram:
+    """Fixed-edge histogram that answers approximate quantiles in bounded memory.
+
+    One histogram is kept per element of ``low``/``high`` (e.g. one per projection year). Values below
+    ``low`` or above ``high`` land in under/overflow bins, so quantiles are clipped to the edges.
+    Histograms with the same edges merge by adding counts, which is how chunks evaluated in
+    different processes are combined.
+    """
+
+    def __init__(self, low, high, bins=2048):
+        self.low = np.asarray(low, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.bins = bins
+        self.counts = np.zeros(self.low.shape + (bins + 2,), dtype=np.int64)
+
+    @property
+    def width(self):
+        return (self.high - self.low) / self.bins
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).reshape((-1,) + self.low.shape)
+        index = np.floor((values - self.low) / self.width).astype(np.int64) + 1
+        np.clip(index, 0, self.bins + 1, out=index)
+        cells = self.low.size
+        offsets = np.arange(cells) * (self.bins + 2)
+        flat = (index.reshape(-1, cells) + offsets).ravel()
+        self.counts += np.bincount(flat, minlength=cells * (self.bins + 2)).reshape(self.counts.shape)
+
+    def merge(self, counts):
+        self.counts += counts
+
+    def quantile(self, q):
+        """Linearly interpolated quantile(s), shape (len(q),) + shape."""
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        cumulative = np.cumsum(self.counts, axis=-1)
+        total = cumulative[..., -1:]
+        # inner edges of the bins, with the under/overflow bins collapsed onto low/high
+        edges = self.low[..., None] + self.width[..., None] * np.arange(self.bins + 1)
+        result = np.empty(q.shape + self.low.shape)
+        for j, quantile in enumerate(q):
+            target = quantile * total
+            b = np.minimum((cumulative < target).sum(axis=-1, keepdims=True), self.bins + 1)
+            below = np.where(b > 0, np.take_along_axis(cumulative, np.maximum(b - 1, 0), axis=-1), 0)
+            in_bin = np.take_along_axis(self.counts, b, axis=-1)
+            fraction = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.0)
+            inner = np.clip(b - 1, 0, self.bins - 1)
+            left = np.take_along_axis(edges, inner, axis=-1)
+            value = left + fraction * self.width[..., None]
+            value = np.where(b == 0, self.low[..., None], value)
+            value = np.where(b == self.bins + 1, self.high[..., None], value)
+            result[j] = value[..., 0]
+        return result
+
+
+def correlation_cholesky(correlation, n_inputs=len(INPUTS)):
+    """Validate a correlation matrix and return its lower Cholesky factor."""
+    correlation = np.asarray(correlation, dtype=float)
+    if correlation.shape != (n_inputs, n_inputs):
+        raise ValueError(f'correlation matrix must be {n_inputs}x{n_inputs}, got {correlation.shape}')
+    if not np.allclose(correlation, correlation.T):
+        raise ValueError('correlation matrix must be symmetric')
+    if not np.allclose(np.diag(correlation), 1.0):
+        raise ValueError('correlation matrix must have a unit diagonal')
+    try:
+        return np.linalg.cholesky(correlation)
+    except np.linalg.LinAlgError:
+        raise ValueError('correlation matrix must be positive definite') from None
+
+
+def sample_price_paths(rng, prices, volatility, cholesky, n_draws):
+    """Correlated lognormal price paths around the deterministic series, shape (draws, inputs, years).
+
+    Each year applies a mean-one lognormal shock on top of the previous year's, so uncertainty
+    widens over the horizon; year 0 is the observed base price and is left unshocked.
+    """
+    prices = np.asarray(prices, dtype=float)
+    volatility = np.broadcast_to(np.asarray(volatility, dtype=float), prices.shape[:1])[:, None]
+    n_inputs, years = prices.shape
+    log_shocks = cholesky @ rng.standard_normal((n_draws, n_inputs, years - 1))
+    log_shocks *= volatility
+    log_shocks -= 0.5 * volatility ** 2
+    paths = np.zeros((n_draws, n_inputs, years))
+    np.cumsum(log_shocks, axis=-1, out=paths[..., 1:])
+    np.exp(paths, out=paths)
+    paths *= prices
+    return paths
+
+
+def _base_scenario(parameters):
+    batch = stack_parameters([parameters])
+    return {key: value[0] if isinstance(value, np.ndarray) else value for key, value in batch.items()}
+
+
+def _summarise_chunk(projection, edges):
+    costs = QuantileHistogram(*edges['costs_per_ton'], bins=edges['bins'])
+    costs.update(projection.costs_per_ton)
+    subsidy = QuantileHistogram(*edges['subsidy'], bins=edges['bins'])
+    subsidy.update(projection.subsidy)
+    # shift by one so NO_INTERSECTION (-1) is bin 0
+    tipping = np.bincount(
+        (projection.intersection_year - NO_INTERSECTION).ravel(), minlength=projection.costs_per_ton.shape[-1]
+    )
+    return (
+        costs.counts,
+        subsidy.counts,
+        tipping,
+        projection.costs_per_ton.sum(axis=0),
+        float(projection.subsidy.sum()),
+    )
+
+
+def _simulate_chunk(scenario, volatility, cholesky, seed, n_draws):
+    rng = np.random.default_rng(seed)
+    scenario = dict(scenario)
+    scenario['prices'] = sample_price_paths(rng, scenario['prices'], volatility, cholesky, n_draws)
+    return project_costs(**scenario)
+
+
+def _simulate_and_summarise(scenario, volatility, cholesky, seed, n_draws, edges):
+    return _summarise_chunk(_simulate_chunk(scenario, volatility, cholesky, seed, n_draws), edges)
+
+
+def _padded_edges(values, axis=0):
+    low, high = values.min(axis=axis), values.max(axis=axis)
+    pad = np.maximum(0.5 * (high - low), 1e-6 * np.maximum(np.abs(high), 1.0))
+    return low - pad, high + pad
+
+
+def run_monte_carlo(
+    parameters,
+    n_draws,
+    volatility,
+    correlation,
+    chunk_size=None,
+    workers=None,
+    seed=None,
+    bins=2048,
+    quantiles=DEFAULT_QUANTILES,
+    ):
+    """Sample correlated price paths around ``parameters`` and summarise the projections.
+
+    Draws are evaluated ``chunk_size`` at a time, by default as many as fit in CHUNK_ELEMENTS;
+    only histogram counts and running sums are kept, so memory is bounded by the chunk size rather
+    than ``n_draws``. The first chunk runs in this process to fix the histogram edges, the rest are
+    spread over a process pool of ``workers``, by default one per CPU (``workers=0`` or ``1`` keeps
+    everything in-process).
+    """
+    if n_draws < 1:
+        raise ValueError('n_draws must be at least 1')
+    scenario = _base_scenario(parameters)
+    volatility = np.broadcast_to(np.asarray(volatility, dtype=float), (len(INPUTS),)).copy()
+    if np.any(volatility < 0):
+        raise ValueError('volatility must be non-negative')
+    cholesky = correlation_cholesky(correlation)
+    years = scenario['years']
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // (len(INPUTS) * years))
+
+    sizes = [chunk_size] * (n_draws // chunk_size)
+    if n_draws % chunk_size:
+        sizes.append(n_draws % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    # The first chunk runs here and fixes the histogram range for every other chunk
+    pilot = _simulate_chunk(scenario, volatility, cholesky, seeds[0], sizes[0])
+    edges = {
+        'bins': bins,
+        'costs_per_ton': _padded_edges(pilot.costs_per_ton),
+        'subsidy': _padded_edges(pilot.subsidy),
+    }
+
+    costs = QuantileHistogram(*edges['costs_per_ton'], bins=bins)
+    subsidy = QuantileHistogram(*edges['subsidy'], bins=bins)
+    tipping = np.zeros(years, dtype=np.int64)
+    costs_sum = np.zeros(years)
+    subsidy_sum = 0.0
+
+    def collect(result):
+        nonlocal subsidy_sum
+        costs.merge(result[0])
+        subsidy.merge(result[1])
+        tipping[:] += result[2]
+        costs_sum[:] += result[3]
+        subsidy_sum += result[4]
+
+    collect(_summarise_chunk(pilot, edges))
+    del pilot
+
+    tasks = [(scenario, volatility, cholesky, s, n, edges) for s, n in zip(seeds[1:], sizes[1:])]
+    workers = min((os.cpu_count() or 1) if workers is None else workers, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            collect(_simulate_and_summarise(*task))
+    else:
+        pending = iter(tasks)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # keep at most two chunks per worker in flight so queued draws stay bounded too
+            in_flight = {pool.submit(_simulate_and_summarise, *task) for _, task in zip(range(2 * workers), pending)}
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future.result())
+                    task = next(pending, None)
+                    if task is not None:
+                        in_flight.add(pool.submit(_simulate_and_summarise, *task))
+
+    subsidy_edges = np.linspace(subsidy.low, subsidy.high, bins + 1)
+    return MonteCarloSummary(
+        n_draws=n_draws,
+        quantiles=tuple(quantiles),
+        costs_per_ton_quantiles=costs.quantile(quantiles),
+        mean_costs_per_ton=costs_sum / n_draws,
+        tipping_year_counts={year + NO_INTERSECTION: int(count) for year, count in enumerate(tipping) if count},
+        subsidy_quantiles=subsidy.quantile(quantiles),
+        mean_subsidy=subsidy_sum / n_draws,
+        subsidy_histogram=(subsidy.counts[1:-1], subsidy_edges),
+    )
@@ -0,0 +1,161 @@
+from collections import namedtuple
+
+import numpy as np
+
+from cost_engine import FIXED_PRODUCTION, INPUTS, NO_INTERSECTION, find_intersection_year, subsidy_at, sum_input_costs, waste_fractions
+
+# A fleet of plants as one array per attribute, indexed by plant along the first axis.
+#   capacity:           full annual output (tons)
+#   base_other_costs, base_units (plants, inputs), raw_material_utilisation,
+#   operational_labour_efficiency, target_efficiencies (plants, inputs):
+#                       as in project_costs, per FIXED_PRODUCTION tons of output, so a plant's
+#                       cost per ton doesn't depend on its size
+#   commissioning_year: projection year the plant starts producing, negative for a plant already
+#                       running; waste efficiency gains accumulate from then on (int)
+#   ramp_start:         share of capacity produced in the commissioning year
+#   ramp_years:         years from commissioning to full output, rising linearly (0 is immediate)
+Plants = namedtuple(
+    'Plants',
+    [
+        'capacity',
+        'base_other_costs',
+        'base_units',
+        'raw_material_utilisation',
+        'operational_labour_efficiency',
+        'target_efficiencies',
+        'commissioning_year',
+        'ramp_start',
+        'ramp_years',
+    ],
+)
+
+# costs_per_ton and production are (plants, years), with NaN cost before a plant is commissioned.
+# tipping_year and subsidy are per plant, as in CostProjection (subsidy is NaN for a plant not yet
+# producing in the target year). fleet_costs_per_ton is the production-weighted mean cost per ton
+# per year (NaN in years nothing is produced) and subsidy_bill is the cost, per year, of paying
+# every ton produced above the traditional price down to it.
+PortfolioProjection = namedtuple(
+    'PortfolioProjection',
+    ['costs_per_ton', 'production', 'fleet_costs_per_ton', 'tipping_year', 'subsidy', 'subsidy_bill'],
+)
+
+# Plant table columns with their defaults, for columns a table may leave out
+PLANT_COLUMNS = {'capacity': None, 'commissioning_year': 0, 'ramp_start': 1.0, 'ramp_years': 0.0}
+PARAMETER_COLUMNS = (
+    'base_other_costs',
+    *(f'base_{name}_units' for name in INPUTS),
+    'raw_material_utilisation',
+    'operational_labour_efficiency',
+    *(f'target_efficiency_{name}' for name in INPUTS),
+)
+
+
+def plants_from_table(frame, defaults=None):
+    """Plants from a table with one row per plant (a DataFrame or a dict of columns).
+
+    Columns are ``capacity``, ``commissioning_year``, ``ramp_start`` and ``ramp_years`` plus the
+    plant-level keys of the app's ``parameters`` (``base_hydrogen_units``, ``target_efficiency_carbon``,
+    ...). Parameter columns the table leaves out take their value from ``defaults``, usually the
+    app's ``parameters``, and the others fall back to a plant producing at full capacity from year 0.
+    Blank cells (NaN) take the same default, and are an error in a column without one.
+    """
+    defaults = dict(PLANT_COLUMNS, **(defaults or {}))
+    n = len(frame['capacity']) if 'capacity' in frame else 0
+    missing = [c for c in ('capacity',) + PARAMETER_COLUMNS if c not in frame and defaults.get(c) is None]
+    if missing:
+        raise ValueError(f'plant table is missing columns: {", ".join(missing)}')
+
+    def column(key, dtype=float):
+        values = np.asarray(frame[key], dtype=float) if key in frame else np.full(n, defaults[key], dtype=float)
+        blank = np.isnan(values)
+        if np.any(blank):
+            if defaults.get(key) is None:
+                raise ValueError(f'plant table has blank {key} values')
+            values = np.where(blank, defaults[key], values)
+        return values.astype(dtype)
+
+    plants = Plants(
+        capacity=column('capacity'),
+        base_other_costs=column('base_other_costs'),
+        base_units=np.stack([column(f'base_{name}_units') for name in INPUTS], axis=-1),
+        raw_material_utilisation=column('raw_material_utilisation'),
+        operational_labour_efficiency=column('operational_labour_efficiency'),
+        target_efficiencies=np.stack([column(f'target_efficiency_{name}') for name in INPUTS], axis=-1),
+        commissioning_year=column('commissioning_year', dtype=np.int64),
+        ramp_start=column('ramp_start'),
+        ramp_years=column('ramp_years'),
+    )
+    if np.any(plants.capacity < 0):
+        raise ValueError('plant capacity must not be negative')
+    if np.any((plants.ramp_start < 0) | (plants.ramp_start > 1)):
+        raise ValueError('ramp_start must be a share of capacity between 0 and 1')
+    if np.any(plants.ramp_years < 0):
+        raise ValueError('ramp_years must not be negative')
+    return plants
+
+
+def production_shares(plants, years):
+    """Share of each plant's capacity produced in each year, shape (plants, years)."""
+    age = np.arange(years) - plants.commissioning_year[:, None]
+    ramp_years = plants.ramp_years[:, None]
+    ramp_start = plants.ramp_start[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ramped = ramp_start + (1 - ramp_start) * age / ramp_years
+    shares = np.where(ramp_years > 0, np.minimum(ramped, 1.0), 1.0)
+    return np.where(age >= 0, shares, 0.0)
+
+
+def project_portfolio(plants, prices, years, traditional_price, target_tipping_year):
+    """Cost projection of every plant in a fleet and the fleet-wide totals, in one vectorized pass.
+
+    ``prices`` is (inputs, years) for prices shared by the whole fleet, or (plants, inputs, years);
+    ``traditional_price`` is a scalar or one per plant. A plant's costs follow project_costs with
+    its waste efficiency gains counted from its commissioning year, and a plant commissioned in
+    year 0 gets exactly the costs project_costs gives for its parameters.
+    """
+    prices = np.asarray(prices, dtype=float)
+    if prices.shape[-1] < years:
+        raise ValueError(f'price series have {prices.shape[-1]} values but {years} years were requested')
+    prices = prices[..., :years]
+    traditional_price = np.asarray(traditional_price, dtype=float)
+
+    base_units = plants.base_units[..., None]
+    base_wasted_units = base_units * waste_fractions(plants.raw_material_utilisation, plants.operational_labour_efficiency)[..., None]
+    age = np.arange(years) - plants.commissioning_year[:, None]
+    # the efficiency decay in year y is that of the plant's age, y - commissioning year, which for a
+    # plant commissioned before year 0 runs past the horizon; as decay_factors for age = year
+    decay = np.power((1 - plants.target_efficiencies)[..., None], np.maximum(age, 0)[:, None, :])
+
+    # same operations in the same order as project_input_costs
+    input_costs = np.empty(np.broadcast_shapes(base_wasted_units.shape, decay.shape, prices.shape))
+    np.multiply(base_wasted_units, decay, out=input_costs)
+    np.subtract(base_wasted_units, input_costs, out=input_costs)
+    np.subtract(base_units, input_costs, out=input_costs)
+    np.multiply(input_costs, prices, out=input_costs)
+    costs_per_ton = sum_input_costs(plants.base_other_costs, input_costs) / FIXED_PRODUCTION
+
+    production = plants.capacity[:, None] * production_shares(plants, years)
+    gap = costs_per_ton - (traditional_price[:, None] if traditional_price.ndim else traditional_price)
+    subsidy_bill = (np.maximum(gap, 0.0) * production).sum(axis=0)
+    fleet_production = production.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fleet_costs_per_ton = (costs_per_ton * production).sum(axis=0) / fleet_production
+    fleet_costs_per_ton[fleet_production == 0] = np.nan
+
+    costs_per_ton[age < 0] = np.nan
+    return PortfolioProjection(
+        costs_per_ton=costs_per_ton,
+        production=production,
+        fleet_costs_per_ton=fleet_costs_per_ton,
+        tipping_year=find_intersection_year(costs_per_ton, traditional_price),
+        subsidy=subsidy_at(costs_per_ton, traditional_price, target_tipping_year),
+        subsidy_bill=subsidy_bill,
+    )
+
+
+def tipping_year_counts(projection):
+    """Number of plants reaching the traditional price in each year, and the number that never do."""
+    tipping_year = projection.tipping_year
+    years = projection.costs_per_ton.shape[-1]
+    counts = np.bincount(tipping_year[tipping_year != NO_INTERSECTION], minlength=max(years - 1, 0))
+    return counts, int(np.count_nonzero(tipping_year == NO_INTERSECTION))
@@ -0,0 +1,316 @@
+"""Memory-mapped store of long price histories and forecasts, resampled to the model's time step.
+
+Usage:
+    python price_store.py ingest prices/ electricity_hourly.parquet --input-name electricity
+    python price_store.py ingest prices/ forecasts.csv             # one column per input
+    python price_store.py ingest prices/ long.csv                  # input and price columns
+    python price_store.py info prices/
+
+Each input is kept as two .npy files, sorted timestamps (datetime64[s]) and float64 prices. They
+are opened memory-mapped and read-only, so every session and server process shares the same pages
+of the OS cache instead of holding its own copy, and resampling only reads the rows of the periods
+asked for. Ingesting an input writes new files and then swaps the manifest, so open stores keep
+reading the old version until they are reopened.
+"""
+import argparse
+import json
+import os
+import threading
+import uuid
+from collections import namedtuple
+
+import numpy as np
+
+from cost_engine import INPUTS
+
+# pandas and the readers in batch_runner (pyarrow) are only imported to ingest: reading and
+# resampling a store needs numpy alone, which keeps it quick to import in the app and in workers.
+
+MANIFEST = 'manifest.json'
+FREQUENCIES = {'annual': 'Y', 'monthly': 'M'}
+
+# Per-period mean prices of every input, shape (inputs, periods), and the periods' start dates
+ResampledPrices = namedtuple('ResampledPrices', ['periods', 'prices'])
+SeriesInfo = namedtuple('SeriesInfo', ['rows', 'start', 'end', 'step_seconds'])
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'inputs': {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_manifest(directory, manifest):
+    temporary = os.path.join(directory, f'{MANIFEST}.tmp')
+    with open(temporary, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+
+
+def _to_seconds(values):
+    import pandas as pd
+
+    timestamps = pd.to_datetime(values)
+    if getattr(timestamps.dt, 'tz', None) is not None:
+        timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+    return timestamps.to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def _chunk_series(frame, input_name, timestamp_column):
+    """(input, seconds, prices) for each input in one chunk of a wide, long or single-series table."""
+    if timestamp_column not in frame.columns:
+        raise ValueError(f'price table has no {timestamp_column!r} column')
+    seconds = _to_seconds(frame[timestamp_column])
+    if input_name is not None:
+        values = [column for column in frame.columns if column != timestamp_column]
+        column = 'price' if 'price' in values else (values[0] if len(values) == 1 else None)
+        if column is None:
+            raise ValueError(f'expected a price column or a single value column, got {values}')
+        yield input_name, seconds, frame[column].to_numpy(dtype=float)
+    elif 'input' in frame.columns and 'price' in frame.columns:
+        import pandas as pd
+
+        names = frame['input'].to_numpy()
+        for name in pd.unique(names):
+            rows = names == name
+            yield name, seconds[rows], frame['price'].to_numpy(dtype=float)[rows]
+    else:
+        columns = [name for name in INPUTS if name in frame.columns]
+        if not columns:
+            raise ValueError(f'price table needs a column per input ({", ".join(INPUTS)}), or input and price columns')
+        for name in columns:
+            yield name, seconds, frame[name].to_numpy(dtype=float)
+
+
+def _finish_series(directory, name, seconds_path, prices_path, rows):
+    """Sort and check one ingested input and write it as .npy files; returns its manifest entry."""
+    seconds = np.memmap(seconds_path, dtype=np.int64, mode='r', shape=(rows,))
+    prices = np.memmap(prices_path, dtype=np.float64, mode='r', shape=(rows,))
+    if rows < 2:
+        raise ValueError(f'{name} has {rows} price rows, at least 2 are needed')
+    steps = np.diff(seconds)
+    order = None if np.all(steps > 0) else np.argsort(seconds, kind='stable')
+    if order is not None:
+        steps = np.diff(seconds[order])
+        if not np.all(steps > 0):
+            raise ValueError(f'{name} has {int(np.sum(steps == 0))} duplicate timestamps')
+    missing = int(np.count_nonzero(np.isnan(prices)))
+    if missing:
+        raise ValueError(f'{name} has {missing} missing prices')
+
+    if order is not None:
+        seconds, prices = seconds[order], prices[order]
+
+    stem = f'{name}-{uuid.uuid4().hex[:12]}'
+    for values, suffix in [(seconds.view('datetime64[s]'), 'timestamps'), (prices, 'prices')]:
+        stored = np.lib.format.open_memmap(os.path.join(directory, f'{stem}.{suffix}.npy'), mode='w+', dtype=values.dtype, shape=(rows,))
+        stored[:] = values
+        stored.flush()
+        del stored
+    return {
+        'file': stem,
+        'rows': rows,
+        'start': str(np.datetime64(int(seconds[0]), 's')),
+        'end': str(np.datetime64(int(seconds[-1]), 's')),
+        'step_seconds': float(np.median(steps)),
+    }
+
+
+def _remove_series(directory, stems):
+    for stem in stems:
+        for suffix in ('timestamps', 'prices'):
+            path = os.path.join(directory, f'{stem}.{suffix}.npy')
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def ingest(directory, path, input_name=None, timestamp_column='timestamp', chunk_size=1_000_000):
+    """Load a CSV or Parquet price table into the store, replacing the inputs it contains.
+
+    The table is a timestamp column plus either one column per input (named as in INPUTS), or
+    ``input`` and ``price`` columns, or, with ``input_name``, a single price column. It is read
+    ``chunk_size`` rows at a time, so its size is limited by disk rather than memory.
+    """
+    from batch_runner import read_chunks
+
+    if input_name is not None and input_name not in INPUTS:
+        raise ValueError(f'input must be one of {INPUTS}, got {input_name!r}')
+    os.makedirs(directory, exist_ok=True)
+    staging, rows, written = {}, {}, []
+    try:
+        for frame in read_chunks(path, chunk_size):
+            for name, seconds, prices in _chunk_series(frame, input_name, timestamp_column):
+                if name not in INPUTS:
+                    raise ValueError(f'unknown input {name!r}, expected one of {INPUTS}')
+                if name not in staging:
+                    staging[name] = tuple(open(os.path.join(directory, f'.{name}.{suffix}.tmp'), 'wb') for suffix in ('seconds', 'prices'))
+                    rows[name] = 0
+                staging[name][0].write(seconds.astype(np.int64).tobytes())
+                staging[name][1].write(prices.astype(np.float64).tobytes())
+                rows[name] += len(seconds)
+        for files in staging.values():
+            for file in files:
+                file.close()
+
+        manifest = _read_manifest(directory)
+        replaced = {}
+        for name in staging:
+            entry = _finish_series(directory, name, *(file.name for file in staging[name]), rows[name])
+            written.append(entry['file'])
+            entry['source'] = os.path.abspath(path)
+            if name in manifest['inputs']:
+                replaced[name] = manifest['inputs'][name]['file']
+            manifest['inputs'][name] = entry
+        _write_manifest(directory, manifest)
+    except BaseException:
+        # series already written for this table are not in the manifest, so nothing else removes them
+        _remove_series(directory, written)
+        raise
+    finally:
+        for files in staging.values():
+            for file in files:
+                file.close()
+                if os.path.exists(file.name):
+                    os.unlink(file.name)
+    # readers with the old files mapped keep them until they close them
+    _remove_series(directory, replaced.values())
+    return {name: rows[name] for name in staging}
+
+
+def manifest_mtime(directory):
+    """Modification time of the store's manifest, which changes whenever an input is ingested."""
+    path = os.path.join(directory, MANIFEST)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+class PriceStore:
+    """Read-only, memory-mapped view of a price store directory.
+
+    ``resample`` averages each input's prices over calendar years or months and checks that every
+    input covers every period asked for; results are memoized, as the store never changes under
+    an open instance.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        manifest = _read_manifest(directory)
+        self.info = {
+            name: SeriesInfo(entry['rows'], np.datetime64(entry['start']), np.datetime64(entry['end']), entry['step_seconds'])
+            for name, entry in manifest['inputs'].items()
+        }
+        self._series = {
+            name: tuple(
+                np.load(os.path.join(directory, f'{entry["file"]}.{suffix}.npy'), mmap_mode='r')
+                for suffix in ('timestamps', 'prices')
+            )
+            for name, entry in manifest['inputs'].items()
+        }
+        self._resampled = {}
+        self._lock = threading.Lock()
+
+    @property
+    def inputs(self):
+        return [name for name in INPUTS if name in self._series]
+
+    def series(self, name):
+        """Memory-mapped (timestamps, prices) of one input."""
+        return self._series[name]
+
+    def common_periods(self, frequency='annual'):
+        """First and last period that every input covers completely, as datetime64 of the frequency's unit."""
+        unit = FREQUENCIES[frequency]
+        self._check_inputs()
+        firsts, lasts = [], []
+        for name in INPUTS:
+            timestamps, _ = self._series[name]
+            first, last = timestamps[0].astype(f'datetime64[{unit}]'), timestamps[-1].astype(f'datetime64[{unit}]')
+            # a period the series starts inside of, or ends before the last step of, is incomplete
+            if first.astype('datetime64[s]') < timestamps[0]:
+                first += 1
+            if timestamps[-1] + np.timedelta64(int(self.info[name].step_seconds), 's') < (last + 1).astype('datetime64[s]'):
+                last -= 1
+            firsts.append(first)
+            lasts.append(last)
+        return max(firsts), min(lasts)
+
+    def resample(self, frequency='annual', start=None, periods=None, min_coverage=0.9):
+        """Mean price of every input in ``periods`` consecutive calendar years or months from ``start``.
+
+        ``start`` is a year (annual), a 'YYYY-MM' string or any datetime64; by default the first
+        period every input covers completely, and ``periods`` runs to the last one. Raises
+        ValueError naming the inputs and periods with fewer than ``min_coverage`` of the
+        observations expected from the input's usual time step.
+        """
+        if frequency not in FREQUENCIES:
+            raise ValueError(f'frequency must be one of {sorted(FREQUENCIES)}, got {frequency!r}')
+        unit = FREQUENCIES[frequency]
+        first, last = self.common_periods(frequency)
+        start = first if start is None else np.datetime64(str(start), unit)
+        periods = int(last - start) + 1 if periods is None else int(periods)
+        if periods < 1:
+            raise ValueError(f'no complete {frequency} periods from {start} in the stored prices')
+        key = (frequency, start, periods, min_coverage)
+        with self._lock:
+            if key in self._resampled:
+                return self._resampled[key]
+
+        edges = (start + np.arange(periods + 1)).astype('datetime64[s]')
+        seconds = np.diff(edges).astype(float)
+        prices = np.empty((len(INPUTS), periods))
+        gaps = []
+        for k, name in enumerate(INPUTS):
+            timestamps, values = self._series[name]
+            bounds = np.searchsorted(timestamps, edges)
+            counts = np.diff(bounds)
+            coverage = counts / np.maximum(seconds / self.info[name].step_seconds, 1.0)
+            short = np.flatnonzero(coverage < min_coverage)
+            if len(short):
+                gaps.append(f'{name} ({", ".join(str(start + i) for i in short[:5])}{", ..." if len(short) > 5 else ""})')
+                continue
+            # only the rows of the requested periods are read from the mapped file
+            window = np.asarray(values[bounds[0]:bounds[-1]])
+            prices[k] = np.add.reduceat(window, bounds[:-1] - bounds[0]) / counts
+        if gaps:
+            raise ValueError(f'stored prices do not cover every {frequency} period asked for: {"; ".join(gaps)}')
+
+        result = ResampledPrices(start + np.arange(periods), prices)
+        result.prices.flags.writeable = False
+        with self._lock:
+            self._resampled[key] = result
+        return result
+
+    def _check_inputs(self):
+        missing = [name for name in INPUTS if name not in self._series]
+        if missing:
+            raise ValueError(f'price store {self.directory} has no prices for {", ".join(missing)}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingest and inspect price histories and forecasts for the cost model.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = commands.add_parser('ingest', help='load a CSV or Parquet price table into the store')
+    ingest_parser.add_argument('store', help='price store directory')
+    ingest_parser.add_argument('table', help='price table (.csv or .parquet)')
+    ingest_parser.add_argument('--input-name', choices=INPUTS, help='the input a single-series table holds')
+    ingest_parser.add_argument('--timestamp-column', default='timestamp', help='name of the timestamp column')
+    ingest_parser.add_argument('--chunk-size', type=int, default=1_000_000, help='rows read at a time')
+    info_parser = commands.add_parser('info', help='list the stored inputs and the periods they all cover')
+    info_parser.add_argument('store', help='price store directory')
+    args = parser.parse_args(argv)
+
+    if args.command == 'ingest':
+        rows = ingest(args.store, args.table, args.input_name, args.timestamp_column, args.chunk_size)
+        print(', '.join(f'{name}: {n:,} rows' for name, n in rows.items()))
+    store = PriceStore(args.store)
+    for name, info in store.info.items():
+        print(f'{name:<12} {info.rows:>12,} rows  {info.start} to {info.end}  every {info.step_seconds:,.0f}s')
+    if len(store.inputs) == len(INPUTS):
+        for frequency in FREQUENCIES:
+            first, last = store.common_periods(frequency)
+            print(f'complete {frequency} periods: {first} to {last}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+CacheStats = namedtuple('CacheStats', ['hits', 'disk_hits', 'misses', 'evictions', 'entries', 'bytes'])
+
+
+def _canonical(value):
+    # numbers compare by value (20 and 20.0 hash alike) and containers by content
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    return value
+
+
+def parameters_key(parameters, namespace=''):
+    """Stable hash of a ``parameters`` dict, prefixed by what is being cached for it."""
+    payload = json.dumps([namespace, _canonical(parameters)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache of computation results and rendered charts keyed by parameters_key.
+
+    The memory tier is an LRU bounded by entry count and pickled size and hands back the stored
+    object itself. The optional disk tier is a directory of pickles that every server process can
+    share; files are written atomically and the oldest are evicted once ``max_disk_bytes`` is
+    exceeded.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 2 ** 20, directory=None, max_disk_bytes=2 ** 30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self.hits, self.disk_hits, self.misses, self.evictions, len(self._entries), self._bytes)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        if self.directory is not None:
+            try:
+                with open(self._path(key), 'rb') as file:
+                    payload = file.read()
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                pass
+            else:
+                value = pickle.loads(payload)
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value, len(payload))
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, value, len(payload))
+        if self.directory is not None:
+            self._write(key, payload)
+
+    def get_or_compute(self, key, compute, on_lookup=None):
+        # on_lookup(hit) is told whether the value was cached, before anything is computed
+        missing = object()
+        value = self.get(key, missing)
+        if on_lookup is not None:
+            on_lookup(value is not missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remember(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def _write(self, key, payload):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(payload)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
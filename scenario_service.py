@@ -0,0 +1,302 @@
+"""Local JSON/HTTP service for the cost projection, with concurrent requests evaluated in micro-batches.
+
+Usage:
+    python scenario_service.py --port 8502
+    curl -s localhost:8502/evaluate -d @scenario.json
+
+POST /evaluate takes one parameter set (a dict with the same keys as the app's ``parameters``), a
+list of them, or ``{"scenarios": [...]}``, and answers ``{"results": [...]}`` in the same order,
+each result holding ``costs_per_ton`` (one value per year), ``intersection_year`` (null if the
+traditional price is never reached) and ``subsidy``. GET /health reports the queue and GET /metrics
+serves the Prometheus metrics.
+
+Requests wait in a bounded queue while a batch is evaluated, and everything queued by then (up to
+``max_batch`` scenarios, after waiting at most ``max_delay`` for more) is evaluated as the next
+batch in one project_costs call per number of years. When the queue stays full for
+``queue_timeout`` seconds the request is refused with 503 and a Retry-After header, so overload
+shows up as fast refusals rather than growing latency and memory.
+"""
+import argparse
+import asyncio
+import json
+from collections import defaultdict
+from http import HTTPStatus
+
+import numpy as np
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+import instrumentation
+from cost_engine import NO_INTERSECTION, project_costs, stack_parameters
+from instrumentation import REGISTRY, count_scenarios, stage
+
+QUEUE_DEPTH = Gauge('green_steel_service_queue_depth', 'Requests waiting for the next batch', registry=REGISTRY)
+BATCH_SCENARIOS = Histogram(
+    'green_steel_service_batch_scenarios', 'Scenarios evaluated per micro-batch',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384), registry=REGISTRY,
+)
+REQUESTS = Counter('green_steel_service_requests', 'Requests answered, by HTTP status', ['status'], registry=REGISTRY)
+
+# Keys of stack_parameters' output that are per-scenario arrays (years is shared by a group)
+BATCHED_KEYS = (
+    'base_other_costs', 'base_units', 'prices', 'raw_material_utilisation', 'operational_labour_efficiency',
+    'target_efficiencies', 'traditional_price', 'target_tipping_year',
+)
+
+
+class RequestError(Exception):
+    """A request the service refuses, with the HTTP status to answer it with."""
+
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = dict(headers)
+
+
+def parse_scenarios(body, max_scenarios):
+    """Stacked project_costs arguments for the parameter sets in a request body."""
+    try:
+        payload = json.loads(body)
+    except ValueError as error:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'request body is not JSON: {error}')
+    if isinstance(payload, dict) and 'scenarios' in payload:
+        payload = payload['scenarios']
+    parameter_sets = [payload] if isinstance(payload, dict) else payload
+    if not isinstance(parameter_sets, list) or not all(isinstance(p, dict) for p in parameter_sets):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'expected a parameter set, a list of them or {"scenarios": [...]}')
+    if len(parameter_sets) > max_scenarios:
+        raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'at most {max_scenarios} scenarios per request')
+    try:
+        batch = stack_parameters(parameter_sets)
+    except KeyError as error:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'parameter set is missing {error}')
+    except (TypeError, ValueError) as error:
+        raise RequestError(HTTPStatus.BAD_REQUEST, str(error))
+    years, tipping_year = batch['years'], batch['target_tipping_year']
+    if years < 1:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'years must be at least 1')
+    if np.any((tipping_year < -years) | (tipping_year >= years)):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'target_tipping_year must be between {-years} and {years - 1}')
+    return batch
+
+
+def evaluate_requests(batches):
+    """Evaluate several requests' stacked parameters together; returns each request's response body.
+
+    Requests with the same number of years are concatenated into one project_costs call.
+    """
+    groups = defaultdict(list)
+    for position, batch in enumerate(batches):
+        groups[batch['years']].append(position)
+    bodies = [None] * len(batches)
+    for years, positions in groups.items():
+        combined = {key: np.concatenate([batches[p][key] for p in positions]) for key in BATCHED_KEYS}
+        with stage('service_batch'):
+            projection = project_costs(years=years, **combined)
+        count_scenarios('service', len(combined['base_other_costs']))
+        start = 0
+        for p in positions:
+            stop = start + len(batches[p]['base_other_costs'])
+            bodies[p] = json.dumps({'results': [
+                {
+                    'costs_per_ton': costs_per_ton,
+                    'intersection_year': None if year == NO_INTERSECTION else year,
+                    'subsidy': subsidy,
+                }
+                for costs_per_ton, year, subsidy in zip(
+                    projection.costs_per_ton[start:stop].tolist(),
+                    projection.intersection_year[start:stop].tolist(),
+                    projection.subsidy[start:stop].tolist(),
+                )
+            ]}).encode()
+            start = stop
+    return bodies
+
+
+class MicroBatcher:
+    """Bounded queue of parsed requests, drained by one task that evaluates them in batches."""
+
+    def __init__(self, max_batch=4096, max_delay=0.001, max_queue=1024, queue_timeout=1.0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+        self.queue = asyncio.Queue(max_queue)
+
+    async def submit(self, batch):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.queue.put((batch, future)), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, 'service is overloaded, retry later', {'Retry-After': '1'})
+        QUEUE_DEPTH.set(self.queue.qsize())
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        size = len(items[0][0]['base_other_costs'])
+        deadline = loop.time() + self.max_delay
+        while size < self.max_batch:
+            if self.queue.empty():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                items.append(self.queue.get_nowait())
+            size += len(items[-1][0]['base_other_costs'])
+        QUEUE_DEPTH.set(self.queue.qsize())
+        return items, size
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items, size = await self._next_batch()
+            # requests cancelled while queued (on shutdown) don't need evaluating
+            items = [(batch, future) for batch, future in items if not future.cancelled()]
+            if not items:
+                continue
+            BATCH_SCENARIOS.observe(size)
+            try:
+                # in a thread, so the event loop keeps accepting and queueing requests meanwhile
+                bodies = await loop.run_in_executor(None, evaluate_requests, [batch for batch, _ in items])
+            except Exception:
+                # evaluate the requests one by one, so only the ones that fail get the error
+                for batch, future in items:
+                    try:
+                        body, = await loop.run_in_executor(None, evaluate_requests, [batch])
+                    except Exception as error:
+                        if not future.done():
+                            future.set_exception(error)
+                    else:
+                        if not future.done():
+                            future.set_result(body)
+            else:
+                for (_, future), body in zip(items, bodies):
+                    if not future.done():
+                        future.set_result(body)
+
+
+class ScenarioService:
+    """HTTP/1.1 front end (keep-alive, Content-Length bodies) for a MicroBatcher."""
+
+    def __init__(self, max_batch=4096, max_delay=0.001, max_queue=1024, queue_timeout=1.0, max_request_scenarios=10_000, max_body_bytes=16 * 2 ** 20):
+        self.batcher = MicroBatcher(max_batch, max_delay, max_queue, queue_timeout)
+        self.max_request_scenarios = max_request_scenarios
+        self.max_body_bytes = max_body_bytes
+
+    async def start(self, host='127.0.0.1', port=8502):
+        self._worker = asyncio.create_task(self.batcher.run())
+        self.server = await asyncio.start_server(self._connection, host, port)
+        return self.server
+
+    async def _dispatch(self, method, path, body):
+        if path == '/evaluate':
+            if method != 'POST':
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, 'use POST', {'Allow': 'POST'})
+            # json.loads and stack_parameters are Python-level work that grows with the body, so they
+            # run in a thread rather than stalling every other connection on the event loop
+            batch = await asyncio.get_running_loop().run_in_executor(None, parse_scenarios, body, self.max_request_scenarios)
+            try:
+                body = await self.batcher.submit(batch)
+            except RequestError:
+                raise
+            except (ValueError, IndexError) as error:
+                raise RequestError(HTTPStatus.UNPROCESSABLE_ENTITY, f'scenarios could not be evaluated: {error}')
+            except Exception as error:
+                raise RequestError(HTTPStatus.INTERNAL_SERVER_ERROR, f'internal error evaluating scenarios: {error!r}')
+            return HTTPStatus.OK, 'application/json', body
+        if path == '/health' and method == 'GET':
+            queue = self.batcher.queue
+            return HTTPStatus.OK, 'application/json', json.dumps({'status': 'ok', 'queued': queue.qsize(), 'max_queue': queue.maxsize}).encode()
+        if path == '/metrics' and method == 'GET':
+            return HTTPStatus.OK, CONTENT_TYPE_LATEST, generate_latest(REGISTRY)
+        raise RequestError(HTTPStatus.NOT_FOUND, f'no {method} {path}')
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                headers, keep_alive, extra = {}, True, {}
+                # readline raises ValueError for lines over the stream limit, which is malformed too
+                try:
+                    request_line = await reader.readline()
+                    if not request_line.strip():
+                        break
+                    method, target, version = request_line.decode('latin-1').split()
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError('negative Content-Length')
+                except ValueError:
+                    status, content_type, keep_alive = HTTPStatus.BAD_REQUEST, 'application/json', False
+                    payload = b'{"error": "malformed HTTP request"}'
+                else:
+                    try:
+                        if length > self.max_body_bytes:
+                            keep_alive = False
+                            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'request bodies are limited to {self.max_body_bytes} bytes')
+                        body = await reader.readexactly(length)
+                        status, content_type, payload = await self._dispatch(method, target.split('?')[0], body)
+                    except RequestError as error:
+                        status, content_type, extra = error.status, 'application/json', error.headers
+                        payload = json.dumps({'error': str(error)}).encode()
+                    except (ConnectionError, asyncio.IncompleteReadError):
+                        raise
+                    except Exception as error:
+                        status, content_type = HTTPStatus.INTERNAL_SERVER_ERROR, 'application/json'
+                        payload = json.dumps({'error': f'internal error: {error!r}'}).encode()
+                REQUESTS.labels(int(status)).inc()
+                head = [f'HTTP/1.1 {int(status)} {status.phrase}', f'Content-Type: {content_type}', f'Content-Length: {len(payload)}']
+                head += [f'{name}: {value}' for name, value in extra.items()]
+                if not keep_alive:
+                    head.append('Connection: close')
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, **options):
+    service = ScenarioService(**options)
+    server = await service.start(host, port)
+    print(f'serving the cost model on http://{host}:{port}/evaluate', flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the green steel cost projection as a local JSON/HTTP API.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8502, help='port to listen on')
+    parser.add_argument('--max-batch', type=int, default=4096, help='most scenarios evaluated in one batch')
+    parser.add_argument('--max-delay-ms', type=float, default=1.0, help='longest wait for more requests to fill a batch')
+    parser.add_argument('--max-queue', type=int, default=1024, help='most requests waiting for a batch')
+    parser.add_argument('--queue-timeout', type=float, default=1.0, help='seconds a request may wait for queue space before a 503')
+    parser.add_argument('--max-request-scenarios', type=int, default=10_000, help='most scenarios in one request')
+    args = parser.parse_args(argv)
+
+    instrumentation.enable()
+    try:
+        asyncio.run(serve(
+            args.host, args.port,
+            max_batch=args.max_batch, max_delay=args.max_delay_ms / 1000, max_queue=args.max_queue, queue_timeout=args.queue_timeout,
+            max_request_scenarios=args.max_request_scenarios,
+        ))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
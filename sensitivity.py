@@ -0,0 +1,181 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cost_engine import INPUTS, NO_INTERSECTION, project_costs, stack_parameters
+
+# A model input that can be perturbed: its key in the app's ``parameters`` dict, the range it is
+# varied over and its base value. Price series are varied through a multiplier on the whole series.
+Factor = namedtuple('Factor', ['name', 'low', 'high', 'base'])
+
+TornadoBar = namedtuple('TornadoBar', ['name', 'low_output', 'high_output', 'swing'])
+TornadoResult = namedtuple('TornadoResult', ['output', 'base_output', 'bars'])
+SobolResult = namedtuple('SobolResult', ['output', 'names', 'first_order', 'total_order', 'variance', 'n_evaluations'])
+
+PRICE_FACTORS = tuple(f'{name}_prices' for name in INPUTS)
+UNIT_FACTORS = ('base_other_costs',) + tuple(f'base_{name}_units' for name in INPUTS)
+EFFICIENCY_FACTORS = tuple(f'target_efficiency_{name}' for name in INPUTS) + (
+    'raw_material_utilisation',
+    'operational_labour_efficiency',
+)
+
+
+def _final_costs_per_ton(projection):
+    return projection.costs_per_ton[..., -1]
+
+
+def _mean_costs_per_ton(projection):
+    return projection.costs_per_ton.mean(axis=-1)
+
+
+def _subsidy(projection):
+    return projection.subsidy
+
+
+def _tipping_year(projection):
+    # scenarios that never tip are censored at the end of the horizon
+    years = projection.costs_per_ton.shape[-1]
+    return np.where(projection.intersection_year == NO_INTERSECTION, years, projection.intersection_year).astype(float)
+
+
+OUTPUTS = {
+    'final_costs_per_ton': _final_costs_per_ton,
+    'mean_costs_per_ton': _mean_costs_per_ton,
+    'subsidy': _subsidy,
+    'tipping_year': _tipping_year,
+}
+
+
+def default_factors(parameters, relative_range=0.2, efficiency_range=0.1):
+    """Every model input as a Factor around the values in ``parameters``.
+
+    Costs, units and price series vary by +/- ``relative_range`` of their base value; efficiencies
+    and utilisation rates vary by +/- ``efficiency_range`` in absolute terms, clipped to [0, 1].
+    """
+    factors = []
+    for name in EFFICIENCY_FACTORS:
+        base = float(parameters[name])
+        factors.append(Factor(name, max(base - efficiency_range, 0.0), min(base + efficiency_range, 1.0), base))
+    for name in UNIT_FACTORS:
+        base = float(parameters[name])
+        factors.append(Factor(name, base * (1 - relative_range), base * (1 + relative_range), base))
+    for name in PRICE_FACTORS:
+        factors.append(Factor(name, 1 - relative_range, 1 + relative_range, 1.0))
+    return factors
+
+
+def scenario_batch(parameters, factors, samples):
+    """Batched project_costs keyword arguments with each row of ``samples`` applied to ``parameters``."""
+    samples = np.asarray(samples, dtype=float)
+    n = samples.shape[0]
+    batch = stack_parameters([parameters])
+    batch = {key: np.repeat(value, n, axis=0) if isinstance(value, np.ndarray) else value for key, value in batch.items()}
+    price_multipliers = np.ones((n, len(INPUTS), 1))
+
+    for column, factor in enumerate(factors):
+        values = samples[:, column]
+        if factor.name in PRICE_FACTORS:
+            price_multipliers[:, PRICE_FACTORS.index(factor.name), 0] = values
+        elif factor.name.startswith('target_efficiency_'):
+            batch['target_efficiencies'][:, INPUTS.index(factor.name[len('target_efficiency_'):])] = values
+        elif factor.name.startswith('base_') and factor.name.endswith('_units'):
+            batch['base_units'][:, INPUTS.index(factor.name[len('base_'):-len('_units')])] = values
+        elif factor.name in batch:
+            batch[factor.name] = values
+        else:
+            raise ValueError(f'unknown factor {factor.name!r}')
+    batch['prices'] = batch['prices'] * price_multipliers
+    return batch
+
+
+def _evaluate_chunk(parameters, factors, samples, output):
+    return OUTPUTS[output](project_costs(**scenario_batch(parameters, factors, samples)))
+
+
+def evaluate_samples(parameters, factors, samples, output='final_costs_per_ton', chunk_size=100_000, workers=0):
+    """Model output for every row of ``samples``, evaluated in vectorized chunks.
+
+    With ``workers`` > 1 the chunks are spread over a process pool.
+    """
+    if output not in OUTPUTS:
+        raise ValueError(f'output must be one of {sorted(OUTPUTS)}, got {output!r}')
+    samples = np.asarray(samples, dtype=float)
+    chunks = [samples[start:start + chunk_size] for start in range(0, len(samples), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                _evaluate_chunk,
+                [parameters] * len(chunks),
+                [factors] * len(chunks),
+                chunks,
+                [output] * len(chunks),
+            ))
+    else:
+        results = [_evaluate_chunk(parameters, factors, chunk, output) for chunk in chunks]
+    return np.concatenate(results)
+
+
+def tornado(parameters, factors=None, output='final_costs_per_ton'):
+    """One-at-a-time sensitivity: each factor at its low and high value with the rest at base.
+
+    All 2k + 1 scenarios are evaluated in a single batch. Bars are sorted by swing, largest first.
+    """
+    factors = default_factors(parameters) if factors is None else list(factors)
+    k = len(factors)
+    samples = np.tile([factor.base for factor in factors], (2 * k + 1, 1))
+    for column, factor in enumerate(factors):
+        samples[2 * column, column] = factor.low
+        samples[2 * column + 1, column] = factor.high
+    outputs = evaluate_samples(parameters, factors, samples, output)
+
+    bars = [
+        TornadoBar(factor.name, outputs[2 * column], outputs[2 * column + 1], abs(outputs[2 * column + 1] - outputs[2 * column]))
+        for column, factor in enumerate(factors)
+    ]
+    bars.sort(key=lambda bar: bar.swing, reverse=True)
+    return TornadoResult(output, outputs[-1], bars)
+
+
+def saltelli_samples(factors, n, seed=None):
+    """Sample matrices A and B (each n x k) plus the k matrices A_B^i, stacked as n * (k + 2) rows.
+
+    Rows are ordered A, B, A_B^1, ..., A_B^k. Points come from a scrambled Sobol' sequence scaled
+    to each factor's [low, high] range.
+    """
+    from scipy.stats import qmc
+
+    k = len(factors)
+    unit = qmc.Sobol(2 * k, scramble=True, seed=seed).random(n)
+    low = np.array([factor.low for factor in factors])
+    high = np.array([factor.high for factor in factors])
+    a = low + unit[:, :k] * (high - low)
+    b = low + unit[:, k:] * (high - low)
+    blocks = [a, b]
+    for column in range(k):
+        ab = a.copy()
+        ab[:, column] = b[:, column]
+        blocks.append(ab)
+    return np.concatenate(blocks)
+
+
+def sobol_indices(parameters, factors=None, output='final_costs_per_ton', n=1024, seed=None, chunk_size=100_000, workers=0):
+    """Variance-based first-order and total Sobol indices for every factor.
+
+    Uses the Saltelli (2010) first-order and Jansen total-effect estimators over n * (k + 2)
+    evaluations, all taken from one batched sample matrix.
+    """
+    factors = default_factors(parameters) if factors is None else list(factors)
+    k = len(factors)
+    samples = saltelli_samples(factors, n, seed)
+    outputs = evaluate_samples(parameters, factors, samples, output, chunk_size=chunk_size, workers=workers)
+
+    f_a, f_b, f_ab = outputs[:n], outputs[n:2 * n], outputs[2 * n:].reshape(k, n)
+    variance = np.var(np.concatenate([f_a, f_b]))
+    if variance == 0:
+        first_order = np.zeros(k)
+        total_order = np.zeros(k)
+    else:
+        first_order = np.mean(f_b * (f_ab - f_a), axis=1) / variance
+        total_order = 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance
+    return SobolResult(output, [factor.name for factor in factors], first_order, total_order, variance, len(samples))
@@ -0,0 +1,150 @@
+from collections import namedtuple
+
+import numpy as np
+
+from cost_engine import FIXED_PRODUCTION, NO_INTERSECTION, project_costs, stack_parameters
+
+# Per-scenario results, batched over parameter sets. subsidy is £/ton and spend £, both
+# (scenarios, years); earliest_year is the earliest required year the budget caps allow, or
+# NO_INTERSECTION if even the final year is out of reach.
+SubsidySchedule = namedtuple('SubsidySchedule', ['subsidy', 'spend', 'discounted_spend', 'feasible', 'earliest_year'])
+
+
+def competitiveness_gaps(parameters, traditional_price=None):
+    """Cost per ton above the traditional price in every year, shape (scenarios, years).
+
+    ``parameters`` is one parameter set or a list of them (e.g. one per price scenario).
+    ``traditional_price`` replaces the constant price in the parameters with a path, (years,) for
+    every scenario or (scenarios, years).
+    """
+    parameter_sets = [parameters] if isinstance(parameters, dict) else list(parameters)
+    batch = stack_parameters(parameter_sets)
+    years = batch['years']
+    costs_per_ton = project_costs(**batch).costs_per_ton
+    if traditional_price is None:
+        return costs_per_ton - batch['traditional_price'][:, None]
+    traditional_price = np.asarray(traditional_price, dtype=float)
+    if traditional_price.shape[-1] < years:
+        raise ValueError(f'traditional price path has {traditional_price.shape[-1]} values but years is {years}')
+    return costs_per_ton - traditional_price[..., :years]
+
+
+def discount_weights(years, discount_rate=0.0, production=FIXED_PRODUCTION):
+    """Discounted £ spent per £/ton of subsidy in each year: tons produced over (1 + rate) ** year."""
+    if discount_rate <= -1:
+        raise ValueError('discount rate must be above -100%')
+    return np.asarray(production, dtype=float) / (1 + discount_rate) ** np.arange(years)
+
+
+def discounted_spend(schedules, weights):
+    """Total discounted spend of subsidy schedules (..., years) in £/ton.
+
+    The spend is linear in the schedule, so ``weights`` is also its gradient.
+    """
+    return (np.asarray(schedules, dtype=float) * weights).sum(axis=-1)
+
+
+def _required_subsidy(gaps, required_year):
+    # the gap must be closed in the required year and every year after it
+    required_year = np.asarray(required_year)[..., None]
+    return np.where(np.arange(gaps.shape[-1]) >= required_year, np.maximum(gaps, 0.0), 0.0)
+
+
+def least_schedule(lower, max_rise=np.inf, max_fall=np.inf):
+    """Smallest schedule, year by year, that is at least ``lower`` and changes by at most the limits each year.
+
+    ``lower`` is (..., years). ``max_rise`` of 0 gives a schedule that never rises over time. Any
+    schedule satisfying the constraints is at least this one in every year, which is why it also
+    has the lowest spend for any positive year weights.
+    """
+    schedule = np.array(lower, dtype=float)
+    if max_rise < 0 or max_fall < 0:
+        raise ValueError('the limits on the yearly change must not be negative')
+    # a requirement in one year holds up earlier years, less max_rise per year, and later years,
+    # less max_fall per year; one pass each way carries every requirement as far as it reaches
+    for year in range(schedule.shape[-1] - 2, -1, -1):
+        np.maximum(schedule[..., year], schedule[..., year + 1] - max_rise, out=schedule[..., year])
+    for year in range(1, schedule.shape[-1]):
+        np.maximum(schedule[..., year], schedule[..., year - 1] - max_fall, out=schedule[..., year])
+    return schedule
+
+
+def schedule_violation(schedules, gaps, required_year, caps=np.inf, max_rise=np.inf, max_fall=np.inf):
+    """Largest constraint violation (£/ton) of each candidate schedule, 0 where it is feasible.
+
+    ``schedules`` is (..., scenarios, years) so many candidates can be scored against every
+    scenario's ``gaps`` at once; ``caps`` is the most that may be paid per ton in each year.
+    """
+    schedules = np.asarray(schedules, dtype=float)
+    change = np.diff(schedules, axis=-1)
+    violations = [
+        np.max(_required_subsidy(gaps, required_year) - schedules, axis=-1),
+        np.max(-schedules, axis=-1),
+        np.max(schedules - caps, axis=-1),
+    ]
+    if schedules.shape[-1] > 1:
+        violations += [np.max(change - max_rise, axis=-1), np.max(-change - max_fall, axis=-1)]
+    return np.maximum(np.max(violations, axis=0), 0.0)
+
+
+def optimal_subsidy_schedule(
+    parameters,
+    required_year,
+    budget_caps=np.inf,
+    discount_rate=0.0,
+    production=FIXED_PRODUCTION,
+    traditional_price=None,
+    max_rise=np.inf,
+    max_fall=np.inf,
+    ):
+    """Subsidy per ton in each year with the lowest discounted spend that keeps green steel competitive.
+
+    From ``required_year`` on, cost per ton less the subsidy must be at most the traditional price
+    (the path in ``traditional_price`` if given) every year, and each year's spend, subsidy times
+    ``production`` tons, must stay within ``budget_caps`` (£, scalar or per year). ``max_rise`` and
+    ``max_fall`` limit the change of the subsidy per ton from one year to the next.
+
+    These constraints are bounds on each year and on the difference between neighbouring years, so
+    the year-by-year smallest schedule meeting the competitiveness requirement and the change limits
+    is the cheapest one for any discount rate: it is found in closed form for every parameter set at
+    once, and is feasible exactly when it is within the caps. Where it isn't, it is returned anyway
+    with ``feasible`` False, and ``earliest_year`` gives the earliest required year the caps allow.
+    """
+    gaps = competitiveness_gaps(parameters, traditional_price)
+    n, years = gaps.shape
+    required_year = np.broadcast_to(np.asarray(required_year, dtype=int), (n,))
+    if np.any((required_year < 0) | (required_year >= years)):
+        raise ValueError(f'required competitiveness year must be between 0 and {years - 1}')
+    production = np.broadcast_to(np.asarray(production, dtype=float), (years,) if np.ndim(production) < 2 else (n, years))
+    if np.any(production <= 0):
+        raise ValueError('production must be positive')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        caps = np.asarray(budget_caps, dtype=float) / production
+    if np.any(np.isnan(caps) | (caps < 0)):
+        raise ValueError('budget caps must not be negative')
+
+    def within_caps(year):
+        return np.all(least_schedule(_required_subsidy(gaps, year), max_rise, max_fall) <= caps, axis=-1)
+
+    subsidy = least_schedule(_required_subsidy(gaps, required_year), max_rise, max_fall)
+    feasible = np.all(subsidy <= caps, axis=-1)
+
+    # a later required year only lowers the requirements, so the caps allow every year after the
+    # earliest one they allow; bisect for it in all scenarios at once
+    reachable = within_caps(np.full(n, years - 1))
+    low, high = np.zeros(n, dtype=int), np.full(n, years - 1)
+    while np.any(low < high):
+        middle = (low + high) // 2
+        allowed = within_caps(middle)
+        high = np.where(allowed, middle, high)
+        low = np.where(allowed, low, middle + 1)
+    earliest_year = np.where(reachable, low, NO_INTERSECTION)
+
+    weights = discount_weights(years, discount_rate, production)
+    return SubsidySchedule(
+        subsidy=subsidy,
+        spend=subsidy * production,
+        discounted_spend=discounted_spend(subsidy, weights),
+        feasible=feasible,
+        earliest_year=earliest_year,
+    )
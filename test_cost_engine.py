@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from benchmarks import parameters_for
+from cost_engine import INPUTS, NO_INTERSECTION, project_parameter_sets
+
+
+def loop_projection(p):
+    """The app's original scalar projection loop: (costs_per_ton, intersection_year, subsidy)."""
+    fixed_production = 1000
+    costs_per_ton = []
+    intersection_year = None
+    for i in range(p['years']):
+        total_costs = p['base_other_costs']
+        for name in INPUTS:
+            units = p[f'base_{name}_units']
+            utilisation = p['operational_labour_efficiency'] if name == 'labour' else p['raw_material_utilisation']
+            base_wasted_units = units * (1 - utilisation)
+            wasted_units = base_wasted_units * (1 - p[f'target_efficiency_{name}']) ** i
+            total_costs += (units - (base_wasted_units - wasted_units)) * p[f'{name}_prices'][i]
+        costs_per_ton.append(total_costs / fixed_production)
+        if i > 0 and costs_per_ton[-1] <= p['traditional_price'] and intersection_year is None:
+            intersection_year = i - 1
+    return costs_per_ton, intersection_year, costs_per_ton[p['target_tipping_year']] - p['traditional_price']
+
+
+def random_parameter_sets(n, years, seed=0):
+    rng = np.random.default_rng(seed)
+    parameter_sets = []
+    for _ in range(n):
+        p = parameters_for(years)
+        p.update({f'target_efficiency_{name}': rng.uniform(0, 1) for name in INPUTS})
+        p.update({f'{name}_prices': (np.array(p[f'{name}_prices']) * rng.uniform(0.5, 1.5, years)).tolist() for name in INPUTS})
+        p.update(
+            raw_material_utilisation=rng.uniform(0, 1),
+            operational_labour_efficiency=rng.uniform(0, 1),
+            traditional_price=rng.uniform(0.2, 0.6),
+            target_tipping_year=int(rng.integers(0, years)),
+        )
+        parameter_sets.append(p)
+    return parameter_sets
+
+
+@pytest.mark.parametrize('years', [1, 2, 10, 100])
+def test_project_parameter_sets_matches_loop(years):
+    parameter_sets = random_parameter_sets(50, years)
+    projection = project_parameter_sets(parameter_sets)
+    for s, p in enumerate(parameter_sets):
+        costs_per_ton, intersection_year, subsidy = loop_projection(p)
+        assert np.allclose(projection.costs_per_ton[s], costs_per_ton, rtol=1e-14, atol=0)
+        assert projection.intersection_year[s] == (NO_INTERSECTION if intersection_year is None else intersection_year)
+        assert np.isclose(projection.subsidy[s], subsidy, rtol=1e-12, atol=1e-15)
+
+
+def test_one_year_projection():
+    p = dict(parameters_for(1), target_tipping_year=0)
+    projection = project_parameter_sets([p])
+    assert np.allclose(projection.costs_per_ton[0], [0.62])
+    assert projection.intersection_year[0] == NO_INTERSECTION
+    assert np.isclose(projection.subsidy[0], 0.32)
@@ -0,0 +1,73 @@
+import functools
+import itertools
+
+import numpy as np
+import pytest
+
+import efficiency_sweep
+from cost_engine import INPUTS, project_costs, stack_parameters
+from efficiency_sweep import best_over_other_targets, sweep_efficiency_targets
+from test_cost_engine import random_parameter_sets
+
+
+def grid_projection(parameters, grid):
+    # project_costs of every combination of the grid's targets, in the sweep's (C-order) layout
+    batch = {key: value[0] if isinstance(value, np.ndarray) else value for key, value in stack_parameters([parameters]).items()}
+    names = [name for name in INPUTS if name in grid]
+    combinations = np.array(list(itertools.product(*(grid[name] for name in names))))
+    efficiencies = np.tile(batch['target_efficiencies'], (len(combinations), 1))
+    for column, name in enumerate(names):
+        efficiencies[:, INPUTS.index(name)] = combinations[:, column]
+    shape = tuple(len(grid[name]) for name in names)
+    projection = project_costs(**dict(batch, target_efficiencies=efficiencies))
+    return projection, shape
+
+
+def sweep_cases():
+    years = 40
+    parameters = random_parameter_sets(1, years, seed=3)[0]
+    full_grid = {name: np.linspace(0, 1, 4) for name in INPUTS}
+    slice_grid = {'hydrogen': np.linspace(0, 1, 21), 'labour': np.linspace(0, 1, 21)}
+    for grid in (full_grid, slice_grid):
+        # traditional prices that most, about half and hardly any of the grid reach
+        lowest = grid_projection(parameters, grid)[0].costs_per_ton.min(axis=-1)
+        for share in (0.9, 0.5, 0.05):
+            for tipping_year in (0, 7, years - 1, -1, -years):
+                yield grid, dict(parameters, traditional_price=float(np.quantile(lowest, share)), target_tipping_year=tipping_year)
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1_000_000])
+@pytest.mark.parametrize('max_prefix_elements', [1, 2 ** 20])
+def test_sweep_matches_project_costs(monkeypatch, chunk_size, max_prefix_elements):
+    # a small prefix limit leaves some inputs unfolded, so blocks are multi-dimensional
+    monkeypatch.setattr(
+        efficiency_sweep, '_prefix_tables', functools.partial(efficiency_sweep._prefix_tables, max_elements=max_prefix_elements)
+    )
+    for grid, parameters in sweep_cases():
+        projection, shape = grid_projection(parameters, grid)
+        result = sweep_efficiency_targets(parameters, grid, chunk_size=chunk_size, workers=0)
+        assert np.array_equal(result.tipping_year, projection.intersection_year.reshape(shape))
+        assert np.array_equal(result.subsidy, projection.subsidy.reshape(shape))
+        assert result.scenario_years <= projection.costs_per_ton.size
+
+
+def test_sweep_prunes_scenarios_that_cannot_cross():
+    parameters = random_parameter_sets(1, 40, seed=3)[0]
+    grid = {name: np.linspace(0, 1, 4) for name in INPUTS}
+    projection, _ = grid_projection(parameters, grid)
+    parameters['traditional_price'] = float(projection.costs_per_ton.min()) - 1e-3
+    result = sweep_efficiency_targets(parameters, grid, workers=0)
+    assert np.all(result.tipping_year == -1)
+    assert result.scenario_years < projection.costs_per_ton.size / 4
+
+
+def test_best_over_other_targets():
+    parameters = random_parameter_sets(1, 20, seed=1)[0]
+    grid = {name: np.linspace(0, 1, 3) for name in INPUTS}
+    result = sweep_efficiency_targets(parameters, grid, workers=0)
+    tipping_year, subsidy = best_over_other_targets(result, 'carbon', 'hydrogen')
+    never = np.where(result.tipping_year == -1, np.iinfo(int).max, result.tipping_year)
+    for y, x in np.ndindex(3, 3):
+        block = never[y, :, :, x, :]
+        assert subsidy[y, x] == result.subsidy[y, :, :, x, :].min()
+        assert tipping_year[y, x] == (-1 if block.min() == np.iinfo(int).max else block.min())
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from cost_engine import INPUTS, project_costs, stack_parameters
+from incremental_projection import MIN_INCREMENTAL_ELEMENTS, IncrementalProjection
+from test_cost_engine import random_parameter_sets
+
+
+def random_batch(n, years, seed):
+    return stack_parameters(random_parameter_sets(n, years, seed))
+
+
+def change_one_field(rng, batch):
+    # a copy of the batch with one field changed, in one scenario and input where it has them
+    batch = {key: np.copy(value) if isinstance(value, np.ndarray) else value for key, value in batch.items()}
+    n, years = len(batch['base_other_costs']), batch['years']
+    s, k = rng.integers(n), rng.integers(len(INPUTS))
+    key = rng.choice(
+        [
+            'base_other_costs',
+            'base_units',
+            'prices',
+            'raw_material_utilisation',
+            'operational_labour_efficiency',
+            'target_efficiencies',
+            'traditional_price',
+            'target_tipping_year',
+        ]
+    )
+    if key == 'target_tipping_year':
+        batch[key][s] = rng.integers(-years, years)
+    elif key == 'prices':
+        batch[key][s, k, rng.integers(years)] *= rng.uniform(0.5, 1.5)
+    elif key in ('base_units', 'target_efficiencies'):
+        batch[key][s, k] = rng.uniform(0, 1) if key == 'target_efficiencies' else batch[key][s, k] * rng.uniform(0.5, 1.5)
+    else:
+        batch[key][s] *= rng.uniform(0.5, 1.5)
+    return batch
+
+
+def assert_same(projection, batch):
+    expected = project_costs(**batch)
+    for name, got, want in zip(expected._fields, projection, expected):
+        assert np.array_equal(got, want), name
+
+
+@pytest.mark.parametrize('n', [1, 100])
+def test_update_matches_project_costs(n):
+    years = 50
+    assert (n * len(INPUTS) * years >= MIN_INCREMENTAL_ELEMENTS) == (n > 1)
+    rng = np.random.default_rng(n)
+    projection = IncrementalProjection()
+    batch = random_batch(n, years, seed=0)
+    assert_same(projection.update(**batch), batch)
+    for step in range(200):
+        if step % 50 == 25:
+            # a new horizon and new scenarios
+            years = int(rng.integers(40, 60))
+            batch = random_batch(n, years, seed=step)
+        else:
+            batch = change_one_field(rng, batch)
+        assert_same(projection.update(**batch), batch)
+
+
+def test_unchanged_update_recomputes_nothing():
+    batch = random_batch(100, 50, seed=0)
+    projection = IncrementalProjection()
+    projection.update(**batch)
+    assert_same(projection.update(**batch), batch)
+    assert projection.recomputed_inputs == ()
+    batch['target_efficiencies'][:, INPUTS.index('carbon')] = 0.5
+    assert_same(projection.update(**batch), batch)
+    assert projection.recomputed_inputs == ('carbon',)
+
+
+def test_update_after_failed_update():
+    batch = random_batch(100, 50, seed=0)
+    projection = IncrementalProjection()
+    projection.update(**batch)
+    with pytest.raises(ValueError):
+        projection.update(**dict(batch, years=51))
+    assert_same(projection.update(**batch), batch)
+    # fails after the cost columns have been updated in place
+    changed = dict(batch, target_efficiencies=batch['target_efficiencies'] * 0.5, target_tipping_year=batch['target_tipping_year'] + 100)
+    with pytest.raises(IndexError):
+        projection.update(**changed)
+    assert_same(projection.update(**batch), batch)
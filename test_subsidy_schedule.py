@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+from benchmarks import parameters_for
+from cost_engine import FIXED_PRODUCTION, INPUTS
+from subsidy_schedule import competitiveness_gaps, discount_weights, discounted_spend, optimal_subsidy_schedule, schedule_violation
+
+YEARS = 20
+
+
+def price_scenarios(n, seed=0):
+    rng = np.random.default_rng(seed)
+    base = parameters_for(YEARS)
+    return [
+        dict(base, **{f'{name}_prices': (np.array(base[f'{name}_prices']) * rng.uniform(0.7, 1.3, YEARS)).tolist() for name in INPUTS})
+        for _ in range(n)
+    ]
+
+
+def linprog_schedule(gaps, required_year, caps, weights, max_rise, max_fall):
+    # the same problem as a linear programme in one variable per year
+    lower = np.where(np.arange(YEARS) >= required_year, np.maximum(gaps, 0.0), 0.0)
+    rows, bounds = [], []
+    for year in range(YEARS - 1):
+        for sign, limit in ((1, max_rise), (-1, max_fall)):
+            if np.isfinite(limit):
+                row = np.zeros(YEARS)
+                row[year + 1], row[year] = sign, -sign
+                rows.append(row)
+                bounds.append(limit)
+    return linprog(
+        weights,
+        A_ub=np.array(rows) if rows else None,
+        b_ub=bounds or None,
+        bounds=list(zip(lower, np.broadcast_to(caps, (YEARS,)))),
+        method='highs',
+    )
+
+
+CASES = [
+    dict(required_year=0),
+    dict(required_year=3, budget_caps=120.0, discount_rate=0.035),
+    dict(required_year=2, max_rise=0.0, max_fall=0.05, discount_rate=0.1),
+    dict(required_year=1, budget_caps=250.0, max_rise=0.01, max_fall=0.02, traditional_price=np.linspace(0.3, 0.45, YEARS)),
+]
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_schedule_matches_linprog(case):
+    parameter_sets = price_scenarios(8)
+    options = {key: value for key, value in case.items() if key != 'required_year'}
+    result = optimal_subsidy_schedule(parameter_sets, case['required_year'], **options)
+    gaps = competitiveness_gaps(parameter_sets, case.get('traditional_price'))
+    weights = discount_weights(YEARS, case.get('discount_rate', 0.0))
+    caps = case.get('budget_caps', np.inf) / FIXED_PRODUCTION
+    limits = case.get('max_rise', np.inf), case.get('max_fall', np.inf)
+    assert result.feasible.any()
+    for s in range(len(parameter_sets)):
+        lp = linprog_schedule(gaps[s], case['required_year'], caps, weights, *limits)
+        assert result.feasible[s] == (lp.status == 0)
+        if lp.status == 0:
+            assert np.isclose(result.discounted_spend[s], lp.fun, rtol=1e-9, atol=1e-9)
+            assert schedule_violation(result.subsidy[s], gaps[s], case['required_year'], caps, *limits) <= 1e-12
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_no_candidate_is_feasible_and_cheaper(case):
+    rng = np.random.default_rng(1)
+    parameter_sets = price_scenarios(8)
+    options = {key: value for key, value in case.items() if key != 'required_year'}
+    result = optimal_subsidy_schedule(parameter_sets, case['required_year'], **options)
+    gaps = competitiveness_gaps(parameter_sets, case.get('traditional_price'))
+    weights = discount_weights(YEARS, case.get('discount_rate', 0.0))
+    caps = case.get('budget_caps', np.inf) / FIXED_PRODUCTION
+    limits = case.get('max_rise', np.inf), case.get('max_fall', np.inf)
+
+    # candidates around the optimum, and the optimum shifted down and up as a whole: shifted up it
+    # still meets the change limits and is feasible wherever the caps leave room
+    noise = rng.normal(0, 0.01, (1000,) + result.subsidy.shape)
+    shift = rng.uniform(-0.005, 0.005, (1000,) + result.subsidy.shape[:-1] + (1,))
+    candidates = result.subsidy + np.concatenate([noise, np.broadcast_to(shift, noise.shape)])
+    violation = schedule_violation(candidates, gaps, case['required_year'], caps, *limits)
+    spend = discounted_spend(candidates, weights)
+    assert violation.shape == spend.shape == candidates.shape[:2]
+    # shifting a schedule rounds its yearly changes, so allow for that in the change limits
+    feasible = violation <= 1e-12
+    assert np.any(feasible)
+    cheaper = spend < result.discounted_spend - 1e-9
+    assert not np.any(feasible & cheaper & result.feasible)